@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+avatar_atlas.py - 生成头像精灵图（atlas）
+
+读取 operators_data.json 和 avatars 文件夹，把所有干员头像缩小后拼成一张大图，
+并输出记录每个头像坐标的JSON，前端一次请求即可加载整个对局的头像
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import os
+
+from PIL import Image as PILImage
+
+from avatar_utils import list_avatar_files, load_avatar_manifest, lookup_avatar_filename
+from roster_compact import open_roster
+
+ATLAS_FOLDER = os.path.join('static', 'atlas')
+ATLAS_MAP_FILE = 'avatars_atlas.json'
+ATLAS_IMAGE_NAME = 'avatars_atlas'
+
+
+def load_avatar_tile(image_path, tile_size):
+    """
+    读取头像并等比例缩放到tile_size以内，保留透明通道，居中放入正方形画布
+    """
+    with PILImage.open(image_path) as img:
+        img = img.convert('RGBA')
+        img.thumbnail((tile_size, tile_size), PILImage.Resampling.LANCZOS)
+
+        tile = PILImage.new('RGBA', (tile_size, tile_size), (0, 0, 0, 0))
+        offset = ((tile_size - img.width) // 2, (tile_size - img.height) // 2)
+        tile.paste(img, offset)
+        return tile
+
+
+def collect_avatar_files(json_file='operators_data.json', avatars_folder='avatars'):
+    """
+    按名册顺序收集有头像的干员文件名（与服务端的头像查找规则一致）
+    """
+    avatar_files = list_avatar_files(avatars_folder)
+    avatar_manifest = load_avatar_manifest(avatars_folder)
+
+    filenames = []
+    # 只用到姓名，紧凑名册不会解码其余字段
+    with open_roster(json_file) as operators_data:
+        for operator in operators_data:
+            name = operator.get('姓名', 'Unknown')
+            if name == 'Unknown':
+                continue
+            filename = lookup_avatar_filename(name, avatar_manifest, avatar_files)
+            if filename and filename not in filenames:
+                filenames.append(filename)
+    return filenames
+
+
+def build_atlas(json_file='operators_data.json', avatars_folder='avatars',
+                output_folder=ATLAS_FOLDER, tile_size=80, columns=20):
+    """
+    生成头像精灵图和坐标映射文件，返回坐标映射
+    """
+    filenames = collect_avatar_files(json_file, avatars_folder)
+    if not filenames:
+        print("❌ 没有找到任何头像文件")
+        return None
+
+    columns = min(columns, len(filenames))
+    rows = math.ceil(len(filenames) / columns)
+    width, height = columns * tile_size, rows * tile_size
+
+    print(f"🧩 拼接 {len(filenames)} 个头像: {columns} 列 x {rows} 行, 每格 {tile_size}px")
+
+    atlas = PILImage.new('RGBA', (width, height), (0, 0, 0, 0))
+    sprites = {}
+    for i, filename in enumerate(filenames):
+        x, y = (i % columns) * tile_size, (i // columns) * tile_size
+        try:
+            atlas.paste(load_avatar_tile(os.path.join(avatars_folder, filename), tile_size), (x, y))
+            sprites[filename] = [x, y]
+        except Exception as e:
+            print(f"❌ 处理头像 {filename} 时出错: {e}")
+
+    os.makedirs(output_folder, exist_ok=True)
+
+    # PNG使用256色调色板，体积约为真彩色的五分之一
+    png_path = os.path.join(output_folder, f"{ATLAS_IMAGE_NAME}.png")
+    atlas.quantize(256, method=PILImage.Quantize.FASTOCTREE).save(png_path, 'PNG', optimize=True)
+    with open(png_path, 'rb') as f:
+        version = hashlib.md5(f.read()).hexdigest()[:12]
+
+    images = {'png': f"{ATLAS_IMAGE_NAME}.png"}
+    try:
+        atlas.save(os.path.join(output_folder, f"{ATLAS_IMAGE_NAME}.webp"), 'WEBP', quality=80, method=6)
+        images['webp'] = f"{ATLAS_IMAGE_NAME}.webp"
+    except Exception as e:
+        print(f"⚠️ 当前Pillow不支持WebP，仅生成PNG: {e}")
+
+    atlas_map = {
+        'version': version,
+        'tile_size': tile_size,
+        'columns': columns,
+        'width': width,
+        'height': height,
+        'images': images,
+        'sprites': sprites,
+    }
+    with open(os.path.join(output_folder, ATLAS_MAP_FILE), 'w', encoding='utf-8') as f:
+        json.dump(atlas_map, f, ensure_ascii=False, indent=2)
+
+    for fmt, image_name in images.items():
+        size = os.path.getsize(os.path.join(output_folder, image_name))
+        print(f"✅ {fmt.upper()} 精灵图: {image_name} ({size} 字节)")
+    print(f"✅ 坐标映射: {os.path.join(output_folder, ATLAS_MAP_FILE)}")
+    return atlas_map
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="生成干员头像精灵图")
+    parser.add_argument('--json-file', default='operators_data.json')
+    parser.add_argument('--avatars-folder', default='avatars')
+    parser.add_argument('--output-folder', default=ATLAS_FOLDER)
+    parser.add_argument('--tile-size', type=int, default=80, help="每个头像的边长（像素）")
+    parser.add_argument('--columns', type=int, default=20, help="精灵图每行的头像数")
+    args = parser.parse_args()
+
+    build_atlas(args.json_file, args.avatars_folder, args.output_folder, args.tile_size, args.columns)
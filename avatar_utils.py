@@ -0,0 +1,108 @@
+"""
+头像文件相关的公共逻辑
+服务端和构建脚本共用，避免各自维护一份文件名规则
+"""
+
+import json
+import os
+import re
+from urllib.parse import urlparse
+
+# avatar_variants.py 生成的带内容哈希的缩略图
+VARIANTS_FOLDER = os.path.join('static', 'avatars_opt')
+VARIANTS_MANIFEST = 'manifest.json'
+
+# 下载时生成的头像清单（干员姓名 -> 文件名、大小、哈希、尺寸），放在头像文件夹中
+AVATAR_MANIFEST = 'manifest.json'
+
+
+def avatar_download_filename(name, avatar_url):
+    """
+    downloader 保存头像时使用的文件名: {干员名}_{URL中的文件名}
+    """
+    filename = re.sub(r'[<>:"/\\|?*]', '_', os.path.basename(urlparse(avatar_url).path))
+    if not filename.endswith(('.png', '.jpg', '.jpeg')):
+        filename += '.png'
+    # 加上干员名称，避免文件名冲突
+    name_clean = re.sub(r'[<>:"/\\|?*]', '_', name)
+    return f"{name_clean}_{filename}"
+
+
+def avatar_filename_candidates(name):
+    """
+    按优先级列出干员头像可能使用的文件名
+    """
+    return [
+        f"{name}_头像_{name}.png",
+        f"头像_{name}.png",
+        f"{name}.png",
+        f"{name}_头像.png",
+    ]
+
+
+def resolve_avatar_filename(name, avatar_files):
+    """
+    在已列出的头像文件集合中查找干员头像，找不到时返回None
+    """
+    for filename in avatar_filename_candidates(name):
+        if filename in avatar_files:
+            return filename
+    return None
+
+
+def list_avatar_files(avatars_folder='avatars'):
+    """
+    一次性列出头像文件夹中的所有文件名
+    """
+    return set(os.listdir(avatars_folder))
+
+
+def load_variants_manifest(output_folder=VARIANTS_FOLDER):
+    """
+    读取缩略图清单（原始文件名 -> 缩略图信息），不存在或损坏时返回空字典
+    """
+    manifest_path = os.path.join(output_folder, VARIANTS_MANIFEST)
+    if not os.path.exists(manifest_path):
+        return {}
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            return json.load(f).get('avatars', {})
+    except (OSError, ValueError) as e:
+        print(f"⚠️ 读取缩略图清单失败: {e}")
+        return {}
+
+
+def load_avatar_manifest(avatars_folder='avatars'):
+    """
+    读取头像清单（干员姓名 -> {file, bytes, sha256, width, height}），不存在或损坏时返回空字典
+    """
+    manifest_path = os.path.join(avatars_folder, AVATAR_MANIFEST)
+    if not os.path.exists(manifest_path):
+        return {}
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            return json.load(f).get('operators', {})
+    except (OSError, ValueError) as e:
+        print(f"⚠️ 读取头像清单失败: {e}")
+        return {}
+
+
+def write_avatar_manifest(avatars_folder, operators):
+    """
+    原子地写入头像清单
+    """
+    manifest_path = os.path.join(avatars_folder, AVATAR_MANIFEST)
+    temp_path = manifest_path + '.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump({'operators': operators}, f, ensure_ascii=False, indent=2)
+    os.replace(temp_path, manifest_path)
+
+
+def lookup_avatar_filename(name, manifest, avatar_files):
+    """
+    查找干员头像：优先使用头像清单中的记录，清单缺失或过期时按文件名规则查找
+    """
+    entry = manifest.get(name)
+    if entry and entry['file'] in avatar_files:
+        return entry['file']
+    return resolve_avatar_filename(name, avatar_files)
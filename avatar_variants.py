@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+avatar_variants.py - 生成优化后的头像缩略图
+
+把 avatars 文件夹中的原始头像缩小到固定尺寸，分别输出 WebP 和 PNG，
+文件名使用内容哈希，服务端以 immutable 缓存头提供，头像内容变化时URL随之变化
+"""
+
+import argparse
+import hashlib
+import io
+import json
+import os
+
+from PIL import Image as PILImage
+
+from avatar_utils import VARIANTS_FOLDER, VARIANTS_MANIFEST, load_variants_manifest
+
+def encode_thumbnail(image_path, size, webp_quality=80):
+    """
+    把头像缩放到size以内，返回 (WebP字节, PNG字节, 宽, 高)
+    """
+    with PILImage.open(image_path) as img:
+        img = img.convert('RGBA')
+        img.thumbnail((size, size), PILImage.Resampling.LANCZOS)
+
+        webp_buffer = io.BytesIO()
+        img.save(webp_buffer, 'WEBP', quality=webp_quality, method=4)
+
+        # PNG作为不支持WebP时的后备，使用256色调色板压缩体积
+        png_buffer = io.BytesIO()
+        img.quantize(256, method=PILImage.Quantize.FASTOCTREE).save(png_buffer, 'PNG', optimize=True)
+
+        return webp_buffer.getvalue(), png_buffer.getvalue(), img.width, img.height
+
+
+def write_hashed(output_folder, data, extension):
+    """
+    以内容哈希命名写入文件，已存在时跳过，返回文件名
+    """
+    filename = f"{hashlib.sha256(data).hexdigest()[:16]}.{extension}"
+    file_path = os.path.join(output_folder, filename)
+    if not os.path.exists(file_path):
+        with open(file_path, 'wb') as f:
+            f.write(data)
+    return filename
+
+
+def build_variants(avatars_folder='avatars', output_folder=VARIANTS_FOLDER, size=160, webp_quality=80):
+    """
+    为所有头像生成缩略图，源文件与参数未变化的头像直接复用上次的结果
+    """
+    if not os.path.exists(avatars_folder):
+        print(f"❌ 错误: 找不到头像文件夹 {avatars_folder}")
+        return None
+
+    os.makedirs(output_folder, exist_ok=True)
+    previous = load_variants_manifest(output_folder)
+
+    manifest = {}
+    generated = reused = failed = 0
+    source_bytes = variant_bytes = 0
+
+    for filename in sorted(os.listdir(avatars_folder)):
+        if not filename.endswith(('.png', '.jpg', '.jpeg')):
+            continue
+
+        source_path = os.path.join(avatars_folder, filename)
+        with open(source_path, 'rb') as f:
+            source_hash = hashlib.sha256(f.read()).hexdigest()
+        source_bytes += os.path.getsize(source_path)
+
+        entry = previous.get(filename)
+        if (entry and entry.get('source_sha256') == source_hash and entry.get('size') == size
+                and entry.get('quality') == webp_quality
+                and os.path.exists(os.path.join(output_folder, entry['webp']))
+                and os.path.exists(os.path.join(output_folder, entry['png']))):
+            manifest[filename] = entry
+            reused += 1
+        else:
+            try:
+                webp_data, png_data, width, height = encode_thumbnail(source_path, size, webp_quality)
+            except Exception as e:
+                print(f"❌ 处理头像 {filename} 时出错: {e}")
+                failed += 1
+                continue
+            manifest[filename] = {
+                'webp': write_hashed(output_folder, webp_data, 'webp'),
+                'png': write_hashed(output_folder, png_data, 'png'),
+                'width': width,
+                'height': height,
+                'size': size,
+                'quality': webp_quality,
+                'source_sha256': source_hash,
+            }
+            generated += 1
+
+        variant_bytes += os.path.getsize(os.path.join(output_folder, manifest[filename]['webp']))
+
+    # 清理不再被引用的旧缩略图
+    referenced = {entry[fmt] for entry in manifest.values() for fmt in ('webp', 'png')}
+    removed = 0
+    for filename in os.listdir(output_folder):
+        if filename != VARIANTS_MANIFEST and filename not in referenced:
+            os.remove(os.path.join(output_folder, filename))
+            removed += 1
+
+    manifest_path = os.path.join(output_folder, VARIANTS_MANIFEST)
+    temp_path = manifest_path + '.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump({'size': size, 'avatars': manifest}, f, ensure_ascii=False, indent=2)
+    os.replace(temp_path, manifest_path)
+
+    print(f"✅ 新生成: {generated}, 复用: {reused}, 失败: {failed}, 清理旧文件: {removed}")
+    if source_bytes:
+        print(f"📦 原图 {source_bytes} 字节 -> WebP缩略图 {variant_bytes} 字节 "
+              f"({variant_bytes / source_bytes:.1%})")
+    return manifest
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="生成带内容哈希的头像缩略图")
+    parser.add_argument('--avatars-folder', default='avatars')
+    parser.add_argument('--output-folder', default=VARIANTS_FOLDER)
+    parser.add_argument('--size', type=int, default=160, help="缩略图边长（像素），默认为显示尺寸的2倍")
+    parser.add_argument('--quality', type=int, default=80, help="WebP压缩质量")
+    args = parser.parse_args()
+
+    build_variants(args.avatars_folder, args.output_folder, args.size, args.quality)
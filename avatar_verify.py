@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+avatar_verify.py - 校验头像文件夹的完整性
+
+并行读取每个头像的文件头（尺寸、色彩模式、格式）并计算内容哈希，
+找出损坏的文件、重复的头像，以及与 operators_data.json 对照缺失或多余的头像，
+输出JSON报告；服务端启动时也用它判断头像是否就绪
+"""
+
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from PIL import Image as PILImage
+
+from boards import BOARD_SIZE
+from avatar_utils import AVATAR_MANIFEST, avatar_download_filename, resolve_avatar_filename, write_avatar_manifest
+from roster_compact import open_roster
+
+AVATAR_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+ALLOWED_MODES = ('RGBA', 'RGB', 'P', 'LA', 'L')
+MIN_AVATAR_SIZE = 64
+VERIFY_REPORT_FILE = 'avatars_report.json'
+
+
+def inspect_avatar(file_path):
+    """
+    读取单个头像的文件头并计算sha256，不解码像素数据
+    返回 {file, bytes, format, width, height, mode, sha256, error}
+    """
+    result = {'file': os.path.basename(file_path), 'bytes': 0, 'format': None, 'width': None,
+              'height': None, 'mode': None, 'sha256': None, 'error': None}
+    try:
+        with open(file_path, 'rb') as f:
+            data = f.read()
+        result['bytes'] = len(data)
+        result['sha256'] = hashlib.sha256(data).hexdigest()
+        with PILImage.open(file_path) as img:
+            result['format'] = img.format
+            result['width'], result['height'] = img.size
+            result['mode'] = img.mode
+    except Exception as e:
+        result['error'] = f"{type(e).__name__}: {e}"
+    return result
+
+
+def check_avatar(info, min_size=MIN_AVATAR_SIZE, allowed_modes=ALLOWED_MODES):
+    """
+    根据文件头信息判断头像是否可用，返回问题描述，没有问题时返回None
+    """
+    if info['error']:
+        return f"无法识别的图片: {info['error']}"
+    if info['format'] not in ('PNG', 'JPEG'):
+        return f"不支持的图片格式: {info['format']}"
+    if min(info['width'], info['height']) < min_size:
+        return f"尺寸过小: {info['width']}x{info['height']}"
+    if info['mode'] not in allowed_modes:
+        return f"不支持的色彩模式: {info['mode']}"
+    return None
+
+
+def inspect_all(file_paths, workers=None):
+    """
+    在进程池中检查所有头像；只有一个CPU时直接在当前进程中检查，省去进程启动的开销
+    服务端会在工作线程中调用，多线程进程中fork子进程并不安全，因此用forkserver（不支持时用spawn）启动子进程
+    """
+    workers = workers or os.cpu_count() or 1
+    if workers <= 1 or len(file_paths) < 2:
+        return [inspect_avatar(path) for path in file_paths]
+    chunksize = max(1, len(file_paths) // (workers * 4))
+    start_method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(start_method)) as executor:
+        return list(executor.map(inspect_avatar, file_paths, chunksize=chunksize))
+
+
+def match_operator_avatar(operator, avatar_files):
+    """
+    找到干员对应的头像文件：优先使用 downloader 按头像URL保存的文件名，其次按文件名规则查找
+    """
+    name = operator.get('姓名', 'Unknown')
+    if operator.get('头像URL'):
+        filename = avatar_download_filename(name, operator['头像URL'])
+        if filename in avatar_files:
+            return filename
+    return resolve_avatar_filename(name, avatar_files)
+
+
+def verify_avatars(json_file='operators_data.json', avatars_folder='avatars', workers=None,
+                   min_size=MIN_AVATAR_SIZE, report_file=None, write_manifest=False, min_operators=BOARD_SIZE):
+    """
+    校验头像文件夹，返回报告字典；report_file不为空时同时写入JSON文件
+    报告中的 ok 为 True 表示没有损坏的头像文件，且至少有min_operators个干员有可用头像（足够生成一局）；
+    缺少头像的干员（如新增后尚未下载）只记录在 missing 中，不影响就绪，服务端会跳过这些干员
+    write_manifest为True时把每个干员的有效头像写入头像清单，供服务端和Excel生成器直接查找
+    """
+    start_time = time.perf_counter()
+    if os.path.isdir(avatars_folder):
+        filenames = sorted(f for f in os.listdir(avatars_folder) if f.endswith(AVATAR_EXTENSIONS))
+    else:
+        filenames = []
+
+    infos = inspect_all([os.path.join(avatars_folder, f) for f in filenames], workers)
+
+    invalid = []
+    by_hash = {}
+    valid_infos = {}
+    for info in infos:
+        problem = check_avatar(info, min_size)
+        if problem:
+            invalid.append({'file': info['file'], 'problem': problem})
+        else:
+            valid_infos[info['file']] = info
+        if info['sha256']:
+            by_hash.setdefault(info['sha256'], []).append(info['file'])
+    duplicates = [files for files in by_hash.values() if len(files) > 1]
+
+    # 与干员名册对照：缺少头像的干员，以及不属于任何干员的头像文件
+    missing = []
+    referenced = set()
+    manifest = {}
+    operator_count = 0
+    if os.path.exists(json_file):
+        # 只用到姓名和头像URL，紧凑名册不会解码其余字段
+        with open_roster(json_file) as operators_data:
+            avatar_files = set(filenames)
+            for operator in operators_data:
+                name = operator.get('姓名', 'Unknown')
+                if name == 'Unknown':
+                    continue
+                operator_count += 1
+                filename = match_operator_avatar(operator, avatar_files)
+                if filename:
+                    referenced.add(filename)
+                    info = valid_infos.get(filename)
+                    if info:
+                        manifest[name] = {key: info[key] for key in ('file', 'bytes', 'sha256', 'width', 'height')}
+                else:
+                    missing.append(name)
+        orphaned = [f for f in filenames if f not in referenced]
+    else:
+        orphaned = []
+
+    report = {
+        'checked_at': datetime.now().isoformat(timespec='seconds'),
+        'avatars_folder': avatars_folder,
+        'operators': operator_count,
+        'files': len(filenames),
+        'valid': len(filenames) - len(invalid),
+        'invalid': invalid,
+        'duplicates': duplicates,
+        'missing': missing,
+        'orphaned': orphaned,
+        'usable': len(manifest),
+        'ok': not invalid and len(manifest) >= min_operators,
+        'elapsed': round(time.perf_counter() - start_time, 3),
+        'avatars': {info['file']: {k: v for k, v in info.items() if k not in ('file', 'error')}
+                    for info in infos},
+    }
+
+    if write_manifest and os.path.isdir(avatars_folder):
+        write_avatar_manifest(avatars_folder, manifest)
+        report['manifest'] = os.path.join(avatars_folder, AVATAR_MANIFEST)
+
+    if report_file:
+        temp_file = f"{report_file}.tmp"
+        with open(temp_file, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        os.replace(temp_file, report_file)
+    return report
+
+
+def print_report(report):
+    """
+    打印校验报告摘要
+    """
+    print(f"🔍 检查 {report['files']} 个头像文件，用时 {report['elapsed']:.3f} 秒")
+    print(f"✅ 有效: {report['valid']}，有可用头像的干员: {report['usable']}")
+    for item in report['invalid']:
+        print(f"❌ {item['file']}: {item['problem']}")
+    for files in report['duplicates']:
+        print(f"⚠️ 内容重复: {', '.join(files)}")
+    if report['missing']:
+        print(f"⚠️ 缺少头像的干员 ({len(report['missing'])}): {', '.join(report['missing'])}")
+    if report['orphaned']:
+        print(f"⚠️ 不属于任何干员的头像 ({len(report['orphaned'])}): {', '.join(report['orphaned'])}")
+    if report.get('manifest'):
+        print(f"📄 头像清单: {report['manifest']}")
+    print("✅ 头像已就绪" if report['ok'] else "❌ 头像未就绪")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="校验头像文件夹的完整性")
+    parser.add_argument('--json-file', default='operators_data.json')
+    parser.add_argument('--avatars-folder', default='avatars')
+    parser.add_argument('--workers', type=int, default=None, help="进程数，默认为CPU核数")
+    parser.add_argument('--min-size', type=int, default=MIN_AVATAR_SIZE, help="头像的最小边长（像素）")
+    parser.add_argument('--report', default=VERIFY_REPORT_FILE, help="JSON报告的输出路径")
+    parser.add_argument('--write-manifest', action='store_true', help="同时更新头像文件夹中的头像清单")
+    args = parser.parse_args()
+
+    result = verify_avatars(args.json_file, args.avatars_folder, args.workers, args.min_size, args.report,
+                            args.write_manifest)
+    print_report(result)
+    print(f"📄 报告: {args.report}")
+    # 未就绪时以非零状态退出，便于在部署脚本中作为检查步骤
+    sys.exit(0 if result['ok'] else 1)
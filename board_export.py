@@ -0,0 +1,76 @@
+"""
+把一天中每分钟的对局导出为静态JSON文件，可部署到CDN / GitHub Pages
+每个文件的内容与同一分钟的对局接口返回的响应体相同：
+  slim/full: 与 /api/operators?view=slim（或完整视图）相同
+  ids: 与 /api/boards/{时间种子} 相同，另外导出 roster.json（与 /api/roster 相同）用于把id换成干员
+"""
+
+import argparse
+import json
+import os
+import time
+from datetime import datetime, timedelta
+
+from boards import TIME_SEED_TZ, get_time_seed
+from main import RosterStore, build_board_response, build_seed_board_response
+
+BOARDS_FOLDER = os.path.join('static', 'boards')
+
+
+def export_day_boards(day=None, output_folder=BOARDS_FOLDER, view='slim',
+                      json_file='operators_data.json', avatars_folder='avatars'):
+    """
+    导出day（默认为北京时间的今天）每分钟的对局，文件名为 {时间种子}.json，并写出 index.json 记录导出的范围
+    """
+    day = day or datetime.now(TIME_SEED_TZ).date()
+    os.makedirs(output_folder, exist_ok=True)
+
+    store = RosterStore(json_file, avatars_folder)
+    operators = store.reload()
+    view_operators = store.slim_operators if view == 'slim' else None
+
+    start_time = time.perf_counter()
+    start = datetime.combine(day, datetime.min.time())
+    seeds = []
+    for minute in range(24 * 60):
+        seed = get_time_seed(start + timedelta(minutes=minute))
+        if view == 'ids':
+            body, _ = build_seed_board_response(len(operators), seed, store.version)
+        else:
+            body, _ = build_board_response(operators, seed, view_operators, roster_version=store.version)
+        with open(os.path.join(output_folder, f"{seed}.json"), 'wb') as f:
+            f.write(body)
+        seeds.append(seed)
+
+    if view == 'ids':
+        with open(os.path.join(output_folder, 'roster.json'), 'wb') as f:
+            f.write(store.roster_body)
+
+    index = {
+        'date': day.isoformat(),
+        'view': view,
+        'roster_version': store.version,
+        'first_seed': seeds[0],
+        'last_seed': seeds[-1],
+        'count': len(seeds),
+    }
+    with open(os.path.join(output_folder, 'index.json'), 'w', encoding='utf-8') as f:
+        json.dump(index, f, ensure_ascii=False, indent=2)
+
+    elapsed = time.perf_counter() - start_time
+    print(f"✅ 已导出 {day.isoformat()} 的 {len(seeds)} 局对局到 {output_folder}（{elapsed:.1f} s）")
+    return index
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="导出一天中每分钟的对局为静态JSON文件")
+    parser.add_argument('--date', default=None, help="导出的日期 YYYY-MM-DD（北京时间），默认为今天")
+    parser.add_argument('--output', default=BOARDS_FOLDER, help="输出文件夹")
+    parser.add_argument('--view', choices=['slim', 'full', 'ids'], default='slim',
+                        help="slim/full: 包含干员记录的对局; ids: 只含干员id，另附名册")
+    parser.add_argument('--json-file', default='operators_data.json')
+    parser.add_argument('--avatars-folder', default='avatars')
+    args = parser.parse_args()
+
+    day = datetime.strptime(args.date, "%Y-%m-%d").date() if args.date else None
+    export_day_boards(day, args.output, args.view, args.json_file, args.avatars_folder)
@@ -0,0 +1,129 @@
+"""
+对局的生成规则：时间种子、按种子选择干员、校验码
+服务端、预生成脚本和静态站导出共用，不依赖fastapi
+"""
+
+import argparse
+import hashlib
+import os
+import random
+import struct
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+BOARD_SIZE = 30
+
+# 时间种子统一按北京时间（UTC+8）计算，不同时区的玩家（包括静态站中在浏览器里生成对局的玩家）同一分钟得到相同的种子
+TIME_SEED_TZ = timezone(timedelta(hours=8))
+
+# 校验码的位数，可通过环境变量 VERIFICATION_CODE_LENGTH 调整（1~18）
+VERIFICATION_CODE_LENGTH = int(os.environ.get('VERIFICATION_CODE_LENGTH', 6))
+
+
+def get_time_seed(now=None):
+    """
+    获取基于当前分钟的时间种子（按 TIME_SEED_TZ 的时间）
+    同一分钟内返回相同的种子；不带时区信息的now视为已是 TIME_SEED_TZ 的时间
+    """
+    if now is None:
+        now = datetime.now(TIME_SEED_TZ)
+    elif now.tzinfo is not None:
+        now = now.astimezone(TIME_SEED_TZ)
+    # 使用年月日时分作为种子，忽略秒
+    time_str = now.strftime("%Y%m%d%H%M")
+    return time_str
+
+
+def select_board_indices(roster_size, seed, count=BOARD_SIZE):
+    """
+    根据种子选出对局干员在名册中的下标
+    使用独立的随机数生成器，不修改全局random状态，可在多线程/多进程中并发调用
+    相同的种子和名册总是得到相同的结果
+    """
+    rng = random.Random(seed)
+    return rng.sample(range(roster_size), count)
+
+
+def select_board_operators(valid_operators, seed, count=BOARD_SIZE):
+    """
+    根据种子选出对局干员
+    """
+    return [valid_operators[i] for i in select_board_indices(len(valid_operators), seed, count)]
+
+
+def select_filtered_indices(roster_size, seed, candidates=None, count=BOARD_SIZE):
+    """
+    根据种子从候选干员中选出对局干员的名册下标，candidates为None时从整个名册中选择
+    相同的种子、筛选条件和名册总是得到相同的结果
+    """
+    if candidates is None:
+        return select_board_indices(roster_size, seed, count)
+    return [candidates[i] for i in select_board_indices(len(candidates), seed, count)]
+
+
+def generate_verification_code(operator_ids, seed, roster_version='', length=None):
+    """
+    生成校验码
+    对 名册版本、种子和按顺序排列的干员id 计算8字节的BLAKE2b摘要，取其整数值的后length位十进制数
+    名册版本不同、干员不同或顺序不同都会得到不同的校验码（除概率为10^-length的碰撞外）
+    """
+    length = VERIFICATION_CODE_LENGTH if length is None else length
+    if not 1 <= length <= 18:
+        raise ValueError(f"校验码位数需在1到18之间: {length}")
+    data = f"{roster_version}:{seed}:".encode('utf-8') + struct.pack(f'<{len(operator_ids)}H', *operator_ids)
+    digest = hashlib.blake2b(data, digest_size=8).digest()
+    return str(int.from_bytes(digest, 'little') % 10 ** length).zfill(length)
+
+
+def legacy_verification_code(operator_names, seed):
+    """
+    旧的校验码：种子加排序后的干员姓名的MD5，只保留4位，仅用于对比碰撞率
+    """
+    data_str = seed + ''.join(sorted(operator_names))
+    hash_hex = hashlib.md5(data_str.encode('utf-8')).hexdigest()
+    return str(int(hash_hex[:8], 16))[-4:].zfill(4)
+
+
+def collision_rate(codes):
+    """
+    任取两局不同的对局时校验码相同的概率
+    """
+    pairs = sum(n * (n - 1) // 2 for n in Counter(codes).values())
+    total = len(codes) * (len(codes) - 1) // 2
+    return pairs / total if total else 0.0
+
+
+def benchmark_verification_codes(seed_count=1_000_000, roster_size=400, length=None):
+    """
+    对seed_count个种子生成对局并计算校验码，统计不同对局之间校验码相同的概率（与理论值10^-length对比），
+    以及旧方案（4位MD5）的碰撞率和两种方案的计算耗时
+    """
+    length = VERIFICATION_CODE_LENGTH if length is None else length
+    names = [f"干员{i}" for i in range(roster_size)]
+    boards = [(str(i), select_board_indices(roster_size, str(i))) for i in range(seed_count)]
+
+    start = time.perf_counter()
+    codes = [generate_verification_code(ids, seed, 'bench', length) for seed, ids in boards]
+    new_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    legacy_codes = [legacy_verification_code([names[i] for i in ids], seed) for seed, ids in boards]
+    legacy_time = time.perf_counter() - start
+
+    print(f"种子数: {seed_count}, 名册大小: {roster_size}")
+    print(f"BLAKE2b {length}位: 碰撞率 {collision_rate(codes):.3e} (理论 {10 ** -length:.0e}), "
+          f"{new_time / seed_count * 1e6:.2f} µs/局")
+    print(f"旧方案 MD5 4位: 碰撞率 {collision_rate(legacy_codes):.3e} (理论 1e-04), "
+          f"{legacy_time / seed_count * 1e6:.2f} µs/局")
+    return codes
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="对局校验码的碰撞率测试")
+    parser.add_argument('--seeds', type=int, default=1_000_000, help="测试的种子数")
+    parser.add_argument('--roster-size', type=int, default=400, help="名册大小")
+    parser.add_argument('--length', type=int, default=None, help="校验码位数，默认为 VERIFICATION_CODE_LENGTH")
+    args = parser.parse_args()
+
+    benchmark_verification_codes(args.seeds, args.roster_size, args.length)
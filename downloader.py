@@ -1,16 +1,28 @@
+import argparse
+import asyncio
+import hashlib
 import json
+import random
 import requests
+from requests.adapters import HTTPAdapter
 import os
-from urllib.parse import urlparse, urljoin
+from email.utils import parsedate_to_datetime
 import time
-from concurrent.futures import ThreadPoolExecutor, as_completed
-import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
-def get_session_with_headers():
+from avatar_utils import avatar_download_filename
+from avatar_verify import VERIFY_REPORT_FILE, print_report, verify_avatars
+
+def get_session_with_headers(pool_size=10):
     """
     创建带有完整请求头的会话
+    连接池大小应不小于并发下载数，使所有线程复用同一批TCP/TLS连接
     """
     session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=2, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
     session.headers.update({
         'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
         'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,image/apng,*/*;q=0.8',
@@ -21,163 +33,580 @@ def get_session_with_headers():
         'Sec-Fetch-Dest': 'document',
         'Sec-Fetch-Mode': 'navigate',
         'Sec-Fetch-Site': 'none',
-        'Cache-Control': 'max-age=0'
+        'Cache-Control': 'max-age=0',
+        # 图片请求需要带上来源页面，否则可能被重定向到HTML页面
+        'Referer': 'https://prts.wiki/'
     })
     return session
 
-def download_avatar(avatar_info, avatars_folder="avatars", max_retries=3):
+# 下载前访问以获取cookies的主页面
+WARM_UP_URL = 'https://prts.wiki/'
+
+_warm_up_lock = threading.Lock()
+
+def warm_up_session(session, warm_up_url=WARM_UP_URL):
     """
-    下载单个头像 - 修复版
+    访问主页面获取cookies，同一会话只访问一次
+    """
+    with _warm_up_lock:
+        if getattr(session, 'warmed_up', False):
+            return
+        try:
+            session.get(warm_up_url, timeout=10)
+        except requests.RequestException:
+            pass  # 忽略主页面访问错误
+        session.warmed_up = True
+
+class RetryableDownloadError(Exception):
+    """
+    服务器限流(429)或临时故障(5xx)，可在等待后重试
+    retry_after为服务器通过 Retry-After 要求等待的秒数
+    """
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+def parse_retry_after(value):
+    """
+    解析 Retry-After 头（秒数或HTTP日期），无法解析时返回None
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+        return max(0.0, retry_at.timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def retry_delay(attempt, retry_after=None, base_delay=1.0, max_delay=60.0):
+    """
+    计算第attempt次重试前的等待时间
+    优先遵循服务器的 Retry-After，否则使用带随机抖动的指数退避，避免所有请求同时重试
+    """
+    if retry_after is not None:
+        return min(retry_after, max_delay) + random.uniform(0, base_delay)
+    return random.uniform(0, min(max_delay, base_delay * (2 ** attempt)))
+
+def resolve_avatar_target(avatar_info, avatars_folder="avatars"):
+    """
+    根据干员信息确定头像的下载地址和本地保存路径
+    返回 (头像URL, 文件名, 文件路径)，没有URL时返回 (None, None, None)
     """
     name = avatar_info.get('姓名', 'Unknown')
     avatar_url = avatar_info.get('头像URL')
     
+    if not avatar_url:
+        return None, None, None
+    
+    # 确保URL是完整的
+    if not avatar_url.startswith('http'):
+        if avatar_url.startswith('//'):
+            avatar_url = 'https:' + avatar_url
+        else:
+            avatar_url = 'https://media.prts.wiki' + avatar_url
+    
+    filename = avatar_download_filename(name, avatar_url)
+    
+    return avatar_url, filename, os.path.join(avatars_folder, filename)
+
+# 头像元数据存储文件（文件名 -> ETag、Last-Modified、大小、sha256）
+AVATAR_META_FILE = 'avatars_meta.json'
+
+# 条件请求的结果
+NOT_MODIFIED = "未变化"
+ALREADY_EXISTS = "文件已存在"
+
+class AvatarMetaStore:
+    """
+    头像元数据存储
+    记录每个头像文件的 ETag / Last-Modified / 大小 / sha256，刷新时用于条件请求
+    """
+    def __init__(self, meta_file=AVATAR_META_FILE):
+        self.meta_file = meta_file
+        self._entries = {}
+        self._lock = threading.Lock()
+        if os.path.exists(meta_file):
+            try:
+                with open(meta_file, 'r', encoding='utf-8') as f:
+                    self._entries = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"警告: 读取头像元数据 {meta_file} 失败，将重新记录: {e}")
+
+    def get(self, filename):
+        with self._lock:
+            return self._entries.get(filename)
+
+    def update(self, filename, entry):
+        with self._lock:
+            self._entries[filename] = entry
+
+    def save(self):
+        """
+        原子地写回元数据文件
+        """
+        with self._lock:
+            temp_file = f"{self.meta_file}.tmp"
+            with open(temp_file, 'w', encoding='utf-8') as f:
+                json.dump(self._entries, f, ensure_ascii=False, indent=2, sort_keys=True)
+            os.replace(temp_file, self.meta_file)
+
+# 下载任务清单文件，记录每个干员的下载状态，用于中断后续传
+DOWNLOAD_JOB_FILE = 'download_job.json'
+
+class DownloadJob:
+    """
+    下载任务清单
+    记录每个干员的状态(pending/downloading/done/skipped/failed)、已下载字节、尝试次数和最后的错误，
+    每次状态变化都写回文件，进程中断后可用 --resume 只处理未完成的干员
+    """
+    FINISHED_STATUSES = ('done', 'skipped')
+
+    def __init__(self, job_file=DOWNLOAD_JOB_FILE, entries=None):
+        self.job_file = job_file
+        self._entries = entries or {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, job_file=DOWNLOAD_JOB_FILE):
+        """
+        读取已有的任务清单，不存在或损坏时返回空清单
+        """
+        entries = {}
+        if os.path.exists(job_file):
+            try:
+                with open(job_file, 'r', encoding='utf-8') as f:
+                    entries = json.load(f).get('operators', {})
+            except (OSError, ValueError) as e:
+                print(f"警告: 读取下载任务清单 {job_file} 失败: {e}")
+        return cls(job_file, entries)
+
+    def reset(self, operators):
+        """
+        为一次新的下载任务登记所有干员
+        """
+        with self._lock:
+            self._entries = {
+                op.get('姓名', 'Unknown'): {'status': 'pending', 'bytes': 0, 'attempts': 0, 'last_error': None}
+                for op in operators
+            }
+        self.save()
+
+    def is_finished(self, name):
+        entry = self._entries.get(name)
+        return entry is not None and entry['status'] in self.FINISHED_STATUSES
+
+    def get(self, name):
+        with self._lock:
+            return dict(self._entries.get(name, {}))
+
+    def update(self, name, save=True, **fields):
+        with self._lock:
+            entry = self._entries.setdefault(
+                name, {'status': 'pending', 'bytes': 0, 'attempts': 0, 'last_error': None}
+            )
+            entry.update(fields)
+        if save:
+            self.save()
+
+    def start_attempt(self, name):
+        with self._lock:
+            entry = self._entries.setdefault(
+                name, {'status': 'pending', 'bytes': 0, 'attempts': 0, 'last_error': None}
+            )
+            entry['status'] = 'downloading'
+            entry['attempts'] += 1
+        self.save()
+
+    def summary(self):
+        counts = {}
+        with self._lock:
+            for entry in self._entries.values():
+                counts[entry['status']] = counts.get(entry['status'], 0) + 1
+        return counts
+
+    def save(self):
+        """
+        原子地写回任务清单
+        """
+        with self._lock:
+            temp_file = f"{self.job_file}.tmp"
+            with open(temp_file, 'w', encoding='utf-8') as f:
+                json.dump({'operators': self._entries}, f, ensure_ascii=False, indent=2)
+            os.replace(temp_file, self.job_file)
+
+def conditional_headers(entry):
+    """
+    根据已记录的元数据构造条件请求头
+    """
+    headers = {}
+    if entry:
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+    return headers
+
+def plan_download(avatar_info, avatars_folder, meta_store=None, refresh=False):
+    """
+    决定一个头像是否需要请求
+    返回 (跳过时的结果, 头像URL, 文件名, 文件路径, 已知元数据)，跳过时结果不为None
+    refresh为True时已存在的文件也会发送条件请求检查是否更新
+    """
+    name = avatar_info.get('姓名', 'Unknown')
+    avatar_url, filename, file_path = resolve_avatar_target(avatar_info, avatars_folder)
+    
     if not avatar_url:
         print(f"警告: {name} 没有头像URL")
-        return False, name, "没有URL"
+        return (False, name, "没有URL"), None, None, None, None
+    
+    entry = None
+    if os.path.exists(file_path):
+        if not refresh:
+            print(f"跳过 {name}: 文件已存在")
+            return (True, name, ALREADY_EXISTS), None, None, None, None
+        # 只有本地文件与记录一致时才使用条件请求，否则重新完整下载
+        entry = meta_store.get(filename) if meta_store else None
+        if entry and entry.get('size') != os.path.getsize(file_path):
+            entry = None
+    
+    return None, avatar_url, filename, file_path, entry
+
+# 支持的图片文件头
+IMAGE_SIGNATURES = {
+    b'\x89PNG\r\n\x1a\n': 'PNG',
+    b'\xff\xd8\xff': 'JPEG',
+}
+IMAGE_HEADER_LENGTH = max(len(signature) for signature in IMAGE_SIGNATURES)
+
+class InvalidImageError(Exception):
+    """
+    下载的内容不是图片，已写入的部分不能用于续传
+    """
+
+def check_image_header(header, content_type=''):
+    """
+    根据文件头确认内容是PNG/JPEG图片，否则抛出异常（通常是被重定向到了HTML页面）
+    """
+    if any(header.startswith(signature) for signature in IMAGE_SIGNATURES):
+        return
+    preview = header[:200].decode('utf-8', errors='ignore').lower()
+    if '<html' in preview or '<!doctype' in preview or '<script' in preview:
+        raise InvalidImageError(f"收到HTML页面而非图片，可能需要登录或有其他限制 (内容类型: {content_type})")
+    raise InvalidImageError(f"内容不是PNG/JPEG图片 (内容类型: {content_type})")
+
+def fetch_avatar(session, name, avatar_url, file_path, known_entry=None, partial=None):
+    """
+    请求一次头像并原子地保存到file_path，失败时不会留下不完整或错误的文件
+    返回新的元数据；服务器返回304（内容未变化）时返回None
+    429和5xx响应抛出 RetryableDownloadError
+    partial为上次中断时记录的 {etag, last_modified}，存在 .part 文件时用 Range 请求续传；
+    网络中断时若服务器支持续传，保留 .part 并把续传信息附在异常的 partial 属性上
+    """
+    temp_path = f"{file_path}.part"
+    headers = conditional_headers(known_entry)
+    
+    # 续传：服务器资源未变化(If-Range)时只返回剩余部分，否则返回完整内容
+    resume_from = 0
+    validator = partial and (partial.get('etag') or partial.get('last_modified'))
+    if validator and os.path.exists(temp_path):
+        resume_from = os.path.getsize(temp_path)
+        if resume_from:
+            headers = {'Range': f"bytes={resume_from}-", 'If-Range': validator}
+    
+    # 请求图片，带上已知的ETag/Last-Modified
+    response = session.get(avatar_url, timeout=30, stream=True, headers=headers)
+    
+    if response.status_code == 304:
+        response.close()
+        return None
+    
+    # 限流或服务器临时故障，交给调用方退避后重试
+    if response.status_code == 429 or response.status_code >= 500:
+        retry_after = parse_retry_after(response.headers.get('Retry-After'))
+        response.close()
+        raise RetryableDownloadError(f"HTTP {response.status_code}", retry_after)
+    
+    # 检查响应状态
+    response.raise_for_status()
+    
+    if response.status_code != 206:
+        resume_from = 0
+    elif resume_from:
+        print(f"  从第 {resume_from} 字节继续下载 {name}")
+    
+    etag = response.headers.get('ETag')
+    last_modified = response.headers.get('Last-Modified')
+    resumable = (response.status_code == 206 or response.headers.get('Accept-Ranges') == 'bytes') \
+        and bool(etag or last_modified)
+    
+    # 边下载边校验：首个数据块必须是图片文件头，内容写入临时文件，全部校验通过后才替换目标文件
+    expected_length = None
+    if response.headers.get('Content-Encoding', 'identity') == 'identity' and response.headers.get('Content-Length'):
+        expected_length = resume_from + int(response.headers['Content-Length'])
+    
+    sha256 = hashlib.sha256()
+    file_size = resume_from
+    header = b''
+    if resume_from:
+        # 续传部分已在上次校验过文件头，只需补上已有内容的哈希
+        header = None
+        with open(temp_path, 'rb') as existing:
+            for block in iter(lambda: existing.read(65536), b''):
+                sha256.update(block)
     
     try:
-        # 确保URL是完整的
-        if not avatar_url.startswith('http'):
-            if avatar_url.startswith('//'):
-                avatar_url = 'https:' + avatar_url
-            else:
-                avatar_url = 'https://media.prts.wiki' + avatar_url
-        
-        # 从URL中提取文件名
-        parsed_url = urlparse(avatar_url)
-        filename = os.path.basename(parsed_url.path)
-        
-        # 清理文件名，确保是有效的文件名
-        filename = re.sub(r'[<>:"/\\|?*]', '_', filename)
-        
-        # 如果没有扩展名，默认为png
-        if not filename.endswith(('.png', '.jpg', '.jpeg')):
-            filename += '.png'
-        
-        # 为了避免文件名冲突，可以加上干员名称
-        name_clean = re.sub(r'[<>:"/\\|?*]', '_', name)
-        filename = f"{name_clean}_{filename}"
+        with open(temp_path, 'ab' if resume_from else 'wb') as file:
+            for chunk in response.iter_content(chunk_size=8192):
+                if not chunk:
+                    continue
+                if header is not None:
+                    # 凑够文件头长度后再判断，判断完成前不写入任何内容
+                    header += chunk
+                    if len(header) < IMAGE_HEADER_LENGTH:
+                        continue
+                    check_image_header(header, response.headers.get('content-type', ''))
+                    chunk, header = header, None
+                file.write(chunk)
+                sha256.update(chunk)
+                file_size += len(chunk)
         
-        # 创建文件路径
-        file_path = os.path.join(avatars_folder, filename)
+        if header is not None:
+            check_image_header(header, response.headers.get('content-type', ''))
+        if expected_length is not None and file_size != expected_length:
+            raise Exception(f"下载不完整: 收到 {file_size} 字节，应为 {expected_length} 字节")
         
-        # 如果文件已存在，跳过下载
-        if os.path.exists(file_path):
-            print(f"跳过 {name}: 文件已存在")
-            return True, name, "文件已存在"
+        os.replace(temp_path, file_path)
+    except Exception as e:
+        # 内容有效但传输中断时保留已下载部分，下次续传；否则删除
+        if resumable and file_size and not isinstance(e, InvalidImageError):
+            e.partial = {'etag': etag, 'last_modified': last_modified, 'bytes': file_size}
+        elif os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    finally:
+        response.close()
+    
+    return {
+        'name': name,
+        'url': avatar_url,
+        'etag': etag,
+        'last_modified': last_modified,
+        'size': file_size,
+        'sha256': sha256.hexdigest(),
+    }
+
+def record_result(name, filename, meta, known_entry, meta_store, job=None):
+    """
+    记录一次成功请求的结果，返回 download_avatar 的结果元组
+    """
+    if meta is None:
+        print(f"未变化 {name}: {filename} (304)")
+        if job is not None:
+            job.update(name, status='done', last_error=None, partial=None)
+        return True, name, NOT_MODIFIED
+    if meta_store is not None:
+        meta_store.update(filename, meta)
+    if job is not None:
+        job.update(name, status='done', bytes=meta['size'], last_error=None, partial=None)
+    if known_entry and known_entry.get('sha256') == meta['sha256']:
+        print(f"重新下载 {name}: {filename} 内容未变化 ({meta['size']} 字节)")
+    else:
+        print(f"成功下载 {name}: {filename} ({meta['size']} 字节)")
+    return True, name, filename
+
+def record_attempt_error(job, name, error, final):
+    """
+    在任务清单中记录一次失败的尝试，返回续传信息
+    """
+    partial = getattr(error, 'partial', None)
+    if job is not None:
+        job.update(
+            name,
+            status='failed' if final else 'downloading',
+            last_error=str(error),
+            partial=partial,
+            bytes=partial['bytes'] if partial else 0,
+        )
+    return partial
+
+def record_skip(job, name, result):
+    """
+    在任务清单中记录跳过（或没有URL）的干员，返回结果元组
+    """
+    if job is not None:
+        job.update(name, status='skipped' if result[0] else 'failed', last_error=None if result[0] else result[2])
+    return result
+
+def download_avatar(avatar_info, avatars_folder="avatars", max_retries=3, session=None,
+                    meta_store=None, refresh=False, job=None):
+    """
+    下载单个头像 - 修复版
+    session为多个下载共享的连接池会话，不传时单独创建
+    meta_store记录头像元数据，refresh为True时对已存在的文件发送条件请求
+    job为下载任务清单，记录每次尝试的状态以便中断后续传
+    """
+    name = avatar_info.get('姓名', 'Unknown')
+    
+    try:
+        skipped, avatar_url, filename, file_path, known_entry = plan_download(
+            avatar_info, avatars_folder, meta_store, refresh
+        )
+        if skipped:
+            return record_skip(job, name, skipped)
+        partial = job.get(name).get('partial') if job is not None else None
         
-        # 创建会话
-        session = get_session_with_headers()
+        # 复用共享会话，首次使用时访问主页面获取cookies
+        if session is None:
+            session = get_session_with_headers(pool_size=1)
+        warm_up_session(session)
         
         for attempt in range(max_retries):
             try:
                 print(f"正在下载 {name} (尝试 {attempt + 1}/{max_retries}): {avatar_url}")
+                if job is not None:
+                    job.start_attempt(name)
+                meta = fetch_avatar(session, name, avatar_url, file_path, known_entry, partial)
+                return record_result(name, filename, meta, known_entry, meta_store, job)
                 
-                # 首先访问主页面获取cookies
-                try:
-                    session.get('https://prts.wiki/', timeout=10)
-                    time.sleep(1)  # 短暂延迟
-                except:
-                    pass  # 忽略主页面访问错误
-                
-                # 请求图片
-                response = session.get(avatar_url, timeout=30, stream=True)
-                
-                # 检查响应状态
-                response.raise_for_status()
-                
-                # 检查内容类型
-                content_type = response.headers.get('content-type', '').lower()
-                print(f"  内容类型: {content_type}")
-                
-                # 检查是否是图片
-                if 'image' not in content_type and 'png' not in content_type:
-                    # 读取一小部分内容检查是否是HTML
-                    content_preview = response.content[:200].decode('utf-8', errors='ignore')
-                    if '<html>' in content_preview.lower() or '<script>' in content_preview.lower():
-                        print(f"  警告: 收到HTML重定向页面而非图片")
-                        
-                        # 尝试其他方法获取图片
-                        # 有时候需要通过引用页面访问
-                        session.headers.update({
-                            'Referer': 'https://prts.wiki/'
-                        })
-                        
-                        # 重新请求
-                        response = session.get(avatar_url, timeout=30, stream=True)
-                        response.raise_for_status()
-                        
-                        content_type = response.headers.get('content-type', '').lower()
-                        print(f"  重新请求后内容类型: {content_type}")
-                
-                # 再次检查内容
-                if 'image' not in content_type:
-                    content_preview = response.content[:200].decode('utf-8', errors='ignore')
-                    if '<html>' in content_preview.lower():
-                        raise Exception("仍然收到HTML页面，可能需要登录或有其他限制")
-                
-                # 保存文件
-                with open(file_path, 'wb') as file:
-                    for chunk in response.iter_content(chunk_size=8192):
-                        if chunk:
-                            file.write(chunk)
-                
-                # 验证文件大小
-                file_size = os.path.getsize(file_path)
-                if file_size < 100:  # 小于100字节可能不是有效图片
-                    with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-                        content = f.read()
-                        if '<html>' in content.lower():
-                            os.remove(file_path)
-                            raise Exception("下载的文件是HTML页面")
-                
-                print(f"成功下载 {name}: {filename} ({file_size} 字节)")
-                return True, name, filename
-                
-            except requests.RequestException as e:
-                if attempt < max_retries - 1:
-                    print(f"下载 {name} 失败，重试 {attempt + 1}/{max_retries}: {e}")
-                    time.sleep(3 + attempt)  # 递增延迟
-                else:
-                    print(f"下载 {name} 最终失败: {e}")
-                    return False, name, str(e)
             except Exception as e:
-                print(f"下载 {name} 时出现异常: {e}")
+                partial = record_attempt_error(job, name, e, final=attempt == max_retries - 1)
                 if attempt < max_retries - 1:
-                    time.sleep(3 + attempt)
+                    delay = retry_delay(attempt, getattr(e, 'retry_after', None))
+                    print(f"下载 {name} 失败，{delay:.1f} 秒后重试 {attempt + 1}/{max_retries}: {e}")
+                    time.sleep(delay)
                 else:
+                    print(f"下载 {name} 最终失败: {e}")
                     return False, name, str(e)
     
     except Exception as e:
         print(f"处理 {name} 时出错: {e}")
         return False, name, str(e)
 
-def test_single_download(operators_data, avatars_folder='avatars'):
+class TokenBucket:
+    """
+    异步令牌桶限速器
+    平均每秒放行rate个请求，最多允许capacity个请求的突发
+    """
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+                self._updated_at = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+async def download_avatar_async(avatar_info, avatars_folder, session, bucket, max_retries=3,
+                                meta_store=None, refresh=False, job=None):
     """
-    测试下载单个头像以验证方法是否有效
+    异步下载单个头像
+    每次请求（包括重试）都先从令牌桶取令牌，请求本身在线程中执行以复用连接池会话
+    """
+    name = avatar_info.get('姓名', 'Unknown')
+    skipped, avatar_url, filename, file_path, known_entry = plan_download(
+        avatar_info, avatars_folder, meta_store, refresh
+    )
+    if skipped:
+        return record_skip(job, name, skipped)
+    partial = job.get(name).get('partial') if job is not None else None
+    
+    for attempt in range(max_retries):
+        await bucket.acquire()
+        try:
+            print(f"正在下载 {name} (尝试 {attempt + 1}/{max_retries}): {avatar_url}")
+            if job is not None:
+                job.start_attempt(name)
+            meta = await asyncio.to_thread(
+                fetch_avatar, session, name, avatar_url, file_path, known_entry, partial
+            )
+            return record_result(name, filename, meta, known_entry, meta_store, job)
+        
+        except Exception as e:
+            partial = record_attempt_error(job, name, e, final=attempt == max_retries - 1)
+            if attempt < max_retries - 1:
+                delay = retry_delay(attempt, getattr(e, 'retry_after', None))
+                print(f"下载 {name} 失败，{delay:.1f} 秒后重试 {attempt + 1}/{max_retries}: {e}")
+                await asyncio.sleep(delay)
+            else:
+                print(f"下载 {name} 最终失败: {e}")
+                return False, name, str(e)
+
+async def download_avatars_async(operators, avatars_folder, session, rps=2.0, concurrency=8, max_retries=3,
+                                 meta_store=None, refresh=False, job=None, warm_up_url=WARM_UP_URL):
+    """
+    并发下载多个头像
+    吞吐量由令牌桶的每秒请求数决定，concurrency只限制同时进行中的请求数
+    调度任何下载之前先用共享会话访问一次主页面获取cookies（已访问过的会话不会重复访问）
+    """
+    await asyncio.to_thread(warm_up_session, session, warm_up_url)
+    bucket = TokenBucket(rps)
+    semaphore = asyncio.Semaphore(concurrency)
+    
+    # 请求在线程中执行，线程数与并发数一致
+    loop = asyncio.get_running_loop()
+    executor = ThreadPoolExecutor(max_workers=concurrency)
+    loop.set_default_executor(executor)
+    
+    async def worker(operator):
+        async with semaphore:
+            try:
+                return await download_avatar_async(
+                    operator, avatars_folder, session, bucket, max_retries, meta_store, refresh, job
+                )
+            except Exception as e:
+                name = operator.get('姓名', 'Unknown')
+                print(f"处理 {name} 时发生异常: {e}")
+                return False, name, str(e)
+    
+    try:
+        return await asyncio.gather(*(worker(operator) for operator in operators))
+    finally:
+        executor.shutdown(wait=False)
+
+def test_single_download(operators_data, avatars_folder='avatars', session=None, meta_store=None, refresh=False,
+                         job=None):
+    """
+    测试下载单个头像以验证方法是否有效，返回该头像的下载结果
     """
     if not operators_data:
         print("没有干员数据")
-        return
+        return None
     
     print("测试下载第一个干员的头像...")
     test_operator = operators_data[0]
     
     os.makedirs(avatars_folder, exist_ok=True)
     
-    success, name, result = download_avatar(test_operator, avatars_folder)
+    result = download_avatar(test_operator, avatars_folder, session=session, meta_store=meta_store, refresh=refresh,
+                             job=job)
     
-    if success:
+    if result[0]:
         print(f"测试成功！可以继续批量下载")
-        return True
     else:
-        print(f"测试失败: {result}")
-        return False
+        print(f"测试失败: {result[2]}")
+    return result
 
-def download_all_avatars(json_file='operators_data.json', avatars_folder='avatars', max_workers=2):
+def download_all_avatars(json_file='operators_data.json', avatars_folder='avatars', rps=2.0, concurrency=8,
+                         max_retries=3, refresh=False, meta_file=AVATAR_META_FILE, resume=False,
+                         job_file=DOWNLOAD_JOB_FILE):
     """
-    批量下载所有头像 - 修复版
+    批量下载所有头像
+    rps为每秒最多发出的请求数，concurrency为同时进行中的请求数
+    refresh为True时对已下载的头像发送条件请求，只重新下载有变化的图片
+    resume为True时读取上次的任务清单，只处理未完成或失败的干员，并续传中断的文件
     """
     if not os.path.exists(json_file):
         print(f"错误: 找不到文件 {json_file}")
@@ -192,98 +621,99 @@ def download_all_avatars(json_file='operators_data.json', avatars_folder='avatar
     
     print(f"找到 {len(operators_data)} 个干员")
     
+    # 任务清单：续传时只调度未完成的干员，否则重新登记全部干员
+    if resume and os.path.exists(job_file):
+        job = DownloadJob.load(job_file)
+        total = len(operators_data)
+        operators_data = [op for op in operators_data if not job.is_finished(op.get('姓名', 'Unknown'))]
+        print(f"续传模式: {total - len(operators_data)} 个已完成，剩余 {len(operators_data)} 个")
+        if not operators_data:
+            print("所有头像都已完成，无需下载")
+            return
+    else:
+        job = DownloadJob(job_file)
+        job.reset(operators_data)
+    
+    # 所有下载共享一个连接池会话，cookies只获取一次
+    session = get_session_with_headers(pool_size=concurrency)
+    meta_store = AvatarMetaStore(meta_file)
+    
+    # 第一个干员可能因文件已存在而跳过测试下载，因此在调度任何下载之前获取cookies
+    warm_up_session(session)
+    
     # 先测试下载一个
-    if not test_single_download(operators_data, avatars_folder):
+    test_result = test_single_download(operators_data, avatars_folder, session, meta_store, refresh, job)
+    if not test_result or not test_result[0]:
         print("测试下载失败，请检查网络连接或网站访问限制")
         return
     
-    print(f"开始批量下载剩余 {len(operators_data)-1} 个干员的头像...")
+    print(f"开始批量下载剩余 {len(operators_data)-1} 个干员的头像 (限速 {rps} 请求/秒, 并发 {concurrency})...")
+    
+    start_time = time.monotonic()
+    try:
+        # 跳过第一个，因为已经测试下载了
+        results = [test_result] + asyncio.run(download_avatars_async(
+            operators_data[1:], avatars_folder, session, rps, concurrency, max_retries, meta_store, refresh, job
+        ))
+    finally:
+        meta_store.save()
+    elapsed = time.monotonic() - start_time
     
     # 统计信息
-    successful_downloads = 1  # 测试下载成功的那个
+    successful_downloads = 0
+    not_modified = 0
     failed_downloads = 0
     skipped_downloads = 0
     
-    # 降低并发数以避免被封
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        # 提交下载任务（跳过第一个，因为已经测试下载了）
-        future_to_operator = {
-            executor.submit(download_avatar, operator, avatars_folder): operator 
-            for operator in operators_data[1:]  # 跳过第一个
-        }
-        
-        # 处理完成的任务
-        for future in as_completed(future_to_operator):
-            operator = future_to_operator[future]
-            try:
-                success, name, result = future.result()
-                if success:
-                    if result == "文件已存在":
-                        skipped_downloads += 1
-                    else:
-                        successful_downloads += 1
-                else:
-                    failed_downloads += 1
-                
-                # 在下载之间添加延迟
-                time.sleep(0)
-                
-            except Exception as e:
-                print(f"处理 {operator.get('姓名', 'Unknown')} 时发生异常: {e}")
-                failed_downloads += 1
+    for success, name, result in results:
+        if success:
+            if result == ALREADY_EXISTS:
+                skipped_downloads += 1
+            elif result == NOT_MODIFIED:
+                not_modified += 1
+            else:
+                successful_downloads += 1
+        else:
+            failed_downloads += 1
     
     # 输出统计结果
-    print(f"\n下载完成!")
-    print(f"成功下载: {successful_downloads}")
+    print(f"\n下载完成! 用时 {elapsed:.1f} 秒")
+    print(f"成功下载 (200): {successful_downloads}")
+    print(f"未变化 (304): {not_modified}")
     print(f"跳过文件: {skipped_downloads}")
     print(f"下载失败: {failed_downloads}")
     print(f"总计处理: {len(operators_data)}")
     print(f"头像保存在: {os.path.abspath(avatars_folder)}")
+    if failed_downloads:
+        print(f"任务清单: {job_file}，可使用 --resume 只重试失败的干员")
 
-def verify_downloaded_images(avatars_folder='avatars'):
+def verify_downloaded_images(avatars_folder='avatars', json_file='operators_data.json', report_file=None):
     """
-    验证下载的图片文件
+    验证下载的图片文件：读取文件头检查格式/尺寸/色彩模式，查找重复和缺失的头像
+    并更新头像清单（干员姓名 -> 文件名、大小、哈希、尺寸），返回校验报告（见 avatar_verify.verify_avatars）
     """
-    if not os.path.exists(avatars_folder):
-        print("头像文件夹不存在")
-        return
-    
-    files = os.listdir(avatars_folder)
-    png_files = [f for f in files if f.endswith(('.png', '.jpg', '.jpeg'))]
-    
-    print(f"\n验证 {len(png_files)} 个图片文件...")
-    
-    valid_count = 0
-    invalid_count = 0
-    
-    for filename in png_files:
-        filepath = os.path.join(avatars_folder, filename)
-        file_size = os.path.getsize(filepath)
-        
-        if file_size < 100:
-            print(f"可疑文件 {filename}: 大小只有 {file_size} 字节")
-            # 检查是否是HTML
-            try:
-                with open(filepath, 'r', encoding='utf-8', errors='ignore') as f:
-                    content = f.read()
-                    if '<html>' in content.lower():
-                        print(f"  -> 这是HTML文件，不是图片")
-                        invalid_count += 1
-                        continue
-            except:
-                pass
-        
-        valid_count += 1
-    
-    print(f"有效图片: {valid_count}")
-    print(f"无效文件: {invalid_count}")
+    report = verify_avatars(json_file, avatars_folder, report_file=report_file, write_manifest=True)
+    print()
+    print_report(report)
+    return report
 
 if __name__ == "__main__":
-    json_file = 'operators_data.json'
-    avatars_folder = 'avatars'
+    parser = argparse.ArgumentParser(description="下载干员头像")
+    parser.add_argument('--json-file', default='operators_data.json')
+    parser.add_argument('--avatars-folder', default='avatars')
+    parser.add_argument('--rps', type=float, default=2.0, help="每秒最多发出的请求数（默认2，避免被封）")
+    parser.add_argument('--concurrency', type=int, default=8, help="同时进行中的请求数")
+    parser.add_argument('--max-retries', type=int, default=3)
+    parser.add_argument('--refresh', action='store_true',
+                        help="对已下载的头像发送条件请求(If-None-Match/If-Modified-Since)，只更新有变化的图片")
+    parser.add_argument('--meta-file', default=AVATAR_META_FILE, help="头像元数据(ETag等)的存储文件")
+    parser.add_argument('--resume', action='store_true', help="根据任务清单只处理未完成或失败的干员，并续传中断的文件")
+    parser.add_argument('--job-file', default=DOWNLOAD_JOB_FILE, help="下载任务清单文件")
+    args = parser.parse_args()
     
-    # 下载所有头像
-    download_all_avatars(json_file, avatars_folder, max_workers=2)
+    # 下载所有头像（每个文件在写入前已校验文件头）
+    download_all_avatars(args.json_file, args.avatars_folder, args.rps, args.concurrency, args.max_retries,
+                         args.refresh, args.meta_file, args.resume, args.job_file)
     
-    # 验证下载的图片
-    verify_downloaded_images(avatars_folder)
+    # 下载结束后校验整个文件夹，确认没有缺失或重复的头像，并生成头像清单
+    verify_downloaded_images(args.avatars_folder, args.json_file, VERIFY_REPORT_FILE)
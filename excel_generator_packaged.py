@@ -12,6 +12,8 @@ from openpyxl.styles import Alignment, Border, Side, PatternFill
 from PIL import Image as PILImage
 import tempfile
 
+from avatar_utils import list_avatar_files, load_avatar_manifest, lookup_avatar_filename
+
 # 尝试导入图片功能
 try:
     from openpyxl.drawing.image import Image
@@ -66,30 +68,14 @@ def check_and_create_output_dir():
     
     return output_dir
 
-def get_avatar_filename(operator_name, avatars_folder):
+def get_avatar_filename(operator_name, avatars_folder, avatar_manifest, avatar_files):
     """
     根据干员姓名获取正确的头像文件名
-    格式: {姓名}_头像_{姓名}.png
+    优先使用下载时生成的头像清单，清单缺失时按文件名规则查找
     """
-    # 基本格式
-    filename = f"{operator_name}_头像_{operator_name}.png"
-    file_path = os.path.join(avatars_folder, filename)
-    
-    if os.path.exists(file_path):
-        return filename, file_path
-    
-    # 如果基本格式不存在，尝试其他可能的格式
-    possible_formats = [
-        f"头像_{operator_name}.png",  # 原始格式
-        f"{operator_name}.png",       # 简单格式
-        f"{operator_name}_头像.png",  # 变体格式
-    ]
-    
-    for format_name in possible_formats:
-        test_path = os.path.join(avatars_folder, format_name)
-        if os.path.exists(test_path):
-            return format_name, test_path
-    
+    filename = lookup_avatar_filename(operator_name, avatar_manifest, avatar_files)
+    if filename:
+        return filename, os.path.join(avatars_folder, filename)
     return None, None
 
 def get_valid_operators(json_file, avatars_folder):
@@ -108,14 +94,17 @@ def get_valid_operators(json_file, avatars_folder):
         with open(json_file, 'r', encoding='utf-8') as file:
             operators_data = json.load(file)
         
+        # 一次性列出头像文件夹并读取头像清单，避免对每个干员逐个探测文件
+        avatar_files = list_avatar_files(avatars_folder)
+        avatar_manifest = load_avatar_manifest(avatars_folder)
+        
         valid_operators = []
         
         for operator in operators_data:
             name = operator.get('姓名', 'Unknown')
             
             if name != 'Unknown':
-                # 使用文件名规则查找文件
-                filename, file_path = get_avatar_filename(name, avatars_folder)
+                filename, file_path = get_avatar_filename(name, avatars_folder, avatar_manifest, avatar_files)
                 
                 if filename and file_path:
                     operator['头像本地路径'] = file_path
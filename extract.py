@@ -1,10 +1,114 @@
+import argparse
+import contextlib
+import io
 import json
 import os
+import time
+from datetime import datetime
+from html.parser import HTMLParser
 from bs4 import BeautifulSoup
 import re
 import hashlib
 
-def extract_operators_info(html_file_path):
+from avatar_utils import avatar_download_filename
+
+def parse_stat_int(value):
+    """
+    整数属性，按精英化阶段列出的取值（如 "11→13"）取最终阶段
+    """
+    return int(value.split('→')[-1])
+
+def parse_stat_seconds(value):
+    """
+    以秒为单位的属性（如 "70s"、"2.9s"），返回秒数
+    """
+    return float(value.split('→')[-1].rstrip('s'))
+
+# 输出为数值的转换函数，原始字符串可按需另存为 原始{字段名}
+NUMERIC_TRANSFORMS = (parse_stat_int, parse_stat_seconds)
+
+# data属性 -> 输出字段 的映射表，按输出顺序排列
+# (属性名, 字段名, 转换函数, 属性值为空时是否跳过)
+# 新增字段只需在此添加一行
+OPERATOR_FIELDS = [
+    # 基本信息
+    ('data-zh', '姓名', None, False),
+    ('data-en', '英文名', None, False),
+    ('data-ja', '日文名', None, False),
+    # 职业信息
+    ('data-profession', '职业', None, False),
+    ('data-subprofession', '子职业', None, False),
+    # 稀有度和阵营
+    ('data-rarity', '稀有度', parse_stat_int, False),
+    ('data-logo', '势力', None, False),
+    ('data-nation', '国家', None, False),
+    ('data-group', '小队', None, True),
+    # 出身和种族
+    ('data-birth_place', '出身地', None, True),
+    ('data-race', '种族', None, True),
+    # 基础属性
+    ('data-hp', '生命值', parse_stat_int, False),
+    ('data-atk', '攻击', parse_stat_int, False),
+    ('data-def', '防御', parse_stat_int, False),
+    ('data-res', '法术抗性', parse_stat_int, False),
+    # 部署属性
+    ('data-re_deploy', '再部署时间', parse_stat_seconds, False),
+    ('data-cost', '部署费用', parse_stat_int, False),
+    ('data-block', '阻挡', parse_stat_int, False),
+    ('data-interval', '攻击间隔', parse_stat_seconds, False),
+    # 标签信息
+    ('data-sex', '性别', None, False),
+    ('data-position', '位置', None, False),
+    ('data-tag', '标签', str.split, True),
+    # 获取方式
+    ('data-obtain_method', '获取方式', None, False),
+]
+
+def build_operator_info(attrs, feature_text, keep_raw=False):
+    """
+    根据干员容器的data属性和纯文本内容构建干员信息
+    attrs为属性字典，feature_text为容器内去除首尾空白后拼接的文本
+    数值属性转换为int/float，keep_raw为True时同时保留原始字符串；无法解析时只保留原始字符串
+    """
+    operator_info = {}
+
+    # 按映射表一次遍历提取所有属性
+    for attr, key, transform, skip_empty in OPERATOR_FIELDS:
+        value = attrs.get(attr)
+        if value is None or (skip_empty and not value):
+            continue
+        if transform in NUMERIC_TRANSFORMS:
+            try:
+                operator_info[key] = transform(value)
+            except ValueError:
+                operator_info[f"原始{key}"] = value
+                continue
+            if keep_raw:
+                operator_info[f"原始{key}"] = value
+        else:
+            operator_info[key] = transform(value) if transform else value
+
+    # 特性（从div的文本内容获取，已移除HTML标签，只保留纯文本）
+    if feature_text:
+        operator_info['特性'] = feature_text
+
+    # 构建头像URL（基于干员名称）
+    # MediaWiki使用文件名的MD5哈希来生成路径: {hash[0]}/{hash[0:2]}/filename
+    if 'data-zh' in attrs:
+        name = attrs['data-zh']
+        filename = f"头像_{name}.png"
+
+        # 计算MD5哈希
+        md5_hash = hashlib.md5(filename.encode('utf-8')).hexdigest()
+
+        # 生成完整URL
+        operator_info['头像URL'] = f"https://media.prts.wiki/{md5_hash[0]}/{md5_hash[0:2]}/{filename}"
+        # 与 downloader 保存头像时使用的文件名一致
+        operator_info['头像本地路径'] = f"avatars/{avatar_download_filename(name, operator_info['头像URL'])}"
+
+    return operator_info
+
+def extract_operators_info(html_file_path, keep_raw=False):
     """
     从HTML文件中提取所有干员信息
     """
@@ -32,108 +136,12 @@ def extract_operators_info(html_file_path):
 
     for container in operator_containers:
         try:
-            operator_info = {}
-
-            # 从data属性中提取所有信息
             attrs = container.attrs
 
-            # 基本信息
-            if 'data-zh' in attrs:
-                operator_info['姓名'] = attrs['data-zh']
-
-            if 'data-en' in attrs:
-                operator_info['英文名'] = attrs['data-en']
-
-            if 'data-ja' in attrs:
-                operator_info['日文名'] = attrs['data-ja']
-
-            # 职业信息
-            if 'data-profession' in attrs:
-                operator_info['职业'] = attrs['data-profession']
-
-            if 'data-subprofession' in attrs:
-                operator_info['子职业'] = attrs['data-subprofession']
-
-            # 稀有度和阵营
-            if 'data-rarity' in attrs:
-                operator_info['稀有度'] = attrs['data-rarity']
-
-            if 'data-logo' in attrs:
-                operator_info['势力'] = attrs['data-logo']
-
-            if 'data-nation' in attrs:
-                operator_info['国家'] = attrs['data-nation']
-
-            if 'data-group' in attrs and attrs['data-group']:
-                operator_info['小队'] = attrs['data-group']
-
-            # 出身和种族
-            if 'data-birth_place' in attrs and attrs['data-birth_place']:
-                operator_info['出身地'] = attrs['data-birth_place']
-
-            if 'data-race' in attrs and attrs['data-race']:
-                operator_info['种族'] = attrs['data-race']
-
-            # 基础属性
-            if 'data-hp' in attrs:
-                operator_info['生命值'] = attrs['data-hp']
-
-            if 'data-atk' in attrs:
-                operator_info['攻击'] = attrs['data-atk']
-
-            if 'data-def' in attrs:
-                operator_info['防御'] = attrs['data-def']
-
-            if 'data-res' in attrs:
-                operator_info['法术抗性'] = attrs['data-res']
-
-            # 部署属性
-            if 'data-re_deploy' in attrs:
-                operator_info['再部署时间'] = attrs['data-re_deploy']
-
-            if 'data-cost' in attrs:
-                operator_info['部署费用'] = attrs['data-cost']
-
-            if 'data-block' in attrs:
-                operator_info['阻挡'] = attrs['data-block']
-
-            if 'data-interval' in attrs:
-                operator_info['攻击间隔'] = attrs['data-interval']
-
-            # 标签信息
-            if 'data-sex' in attrs:
-                operator_info['性别'] = attrs['data-sex']
-
-            if 'data-position' in attrs:
-                operator_info['位置'] = attrs['data-position']
-
-            if 'data-tag' in attrs and attrs['data-tag']:
-                operator_info['标签'] = attrs['data-tag'].split()
-
-            # 获取方式
-            if 'data-obtain_method' in attrs:
-                operator_info['获取方式'] = attrs['data-obtain_method']
-
             # 特性（从div的文本内容获取）
-            feature_text = container.get_text(strip=True)
-            if feature_text:
-                # 移除HTML标签，只保留纯文本
-                from bs4 import NavigableString
-                feature_text = ''.join(container.stripped_strings)
-                operator_info['特性'] = feature_text
-
-            # 构建头像URL（基于干员名称）
-            # MediaWiki使用文件名的MD5哈希来生成路径: {hash[0]}/{hash[0:2]}/filename
-            if 'data-zh' in attrs:
-                name = attrs['data-zh']
-                filename = f"头像_{name}.png"
-
-                # 计算MD5哈希
-                md5_hash = hashlib.md5(filename.encode('utf-8')).hexdigest()
-
-                # 生成完整URL
-                operator_info['头像URL'] = f"https://media.prts.wiki/{md5_hash[0]}/{md5_hash[0:2]}/{filename}"
-                operator_info['头像本地路径'] = f"avatars/{filename}"
+            feature_text = ''.join(container.stripped_strings)
+
+            operator_info = build_operator_info(attrs, feature_text, keep_raw)
 
             # 只添加有姓名的干员
             if '姓名' in operator_info:
@@ -154,29 +162,296 @@ def extract_operators_info(html_file_path):
 
     return operators_data
 
+# 没有结束标签的空元素，不参与嵌套层级的计算
+VOID_ELEMENTS = {
+    'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input',
+    'link', 'meta', 'param', 'source', 'track', 'wbr',
+}
+
+class FilterDataParser(HTMLParser):
+    """
+    流式解析 <div id="filter-data"> 的直接子div
+    每读完一个干员容器就生成一条记录放入 records，不构建整棵文档树
+    """
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.records = []
+        self.finished = False
+        self._stack = []            # 当前打开的标签
+        self._filter_depth = None   # filter-data 所在的层级
+        self._container_attrs = None
+        self._texts = []
+        self._pending_text = []
+
+    def _flush_text(self):
+        # 相邻的文本片段属于同一个文本节点，合并后再去除首尾空白，与 stripped_strings 一致
+        if self._pending_text:
+            text = ''.join(self._pending_text).strip()
+            if text:
+                self._texts.append(text)
+            self._pending_text = []
+
+    def handle_starttag(self, tag, attrs):
+        if self.finished:
+            return
+        self._flush_text()
+        if tag in VOID_ELEMENTS:
+            return
+
+        self._stack.append(tag)
+        depth = len(self._stack)
+
+        if self._filter_depth is None:
+            if tag == 'div' and dict(attrs).get('id') == 'filter-data':
+                self._filter_depth = depth
+        elif tag == 'div' and depth == self._filter_depth + 1:
+            # 与BeautifulSoup一致：重复属性以最后一个为准，无值属性视为空字符串
+            self._container_attrs = {k: (v if v is not None else '') for k, v in attrs}
+            self._texts = []
+
+    def handle_startendtag(self, tag, attrs):
+        self._flush_text()
+
+    def handle_endtag(self, tag):
+        if self.finished or tag not in self._stack:
+            return
+        self._flush_text()
+
+        # 容错处理未闭合的标签：弹出直到匹配的开始标签
+        while self._stack:
+            depth = len(self._stack)
+            open_tag = self._stack.pop()
+
+            if self._filter_depth is not None:
+                if depth == self._filter_depth + 1 and self._container_attrs is not None:
+                    self.records.append((self._container_attrs, ''.join(self._texts)))
+                    self._container_attrs = None
+                elif depth == self._filter_depth:
+                    self.finished = True
+
+            if open_tag == tag:
+                break
+
+    def handle_data(self, data):
+        if self._container_attrs is not None:
+            self._pending_text.append(data)
+
+def iter_operators_streaming(html_file_path, chunk_size=64 * 1024, keep_raw=False):
+    """
+    流式读取HTML文件，逐个产出干员信息
+    读完 filter-data 后立即停止，不再解析文档剩余部分
+    """
+    parser = FilterDataParser()
+
+    with open(html_file_path, 'r', encoding='utf-8') as file:
+        while not parser.finished:
+            chunk = file.read(chunk_size)
+            if not chunk:
+                parser.close()
+            else:
+                parser.feed(chunk)
+
+            for attrs, feature_text in parser.records:
+                try:
+                    operator_info = build_operator_info(attrs, feature_text, keep_raw)
+                except Exception as e:
+                    print(f"提取干员 [{attrs.get('data-zh', '未知')}] 信息时出错: {e}")
+                    continue
+                # 只添加有姓名的干员
+                if '姓名' in operator_info:
+                    yield operator_info
+            parser.records = []
+
+            if not chunk:
+                break
+
+    if parser._filter_depth is None:
+        print("错误: 未找到 <div id=\"filter-data\"> 标签")
+
+def extract_operators_info_streaming(html_file_path, keep_raw=False):
+    """
+    使用流式解析从HTML文件中提取所有干员信息，结果与 extract_operators_info 相同
+    """
+    return list(iter_operators_streaming(html_file_path, keep_raw=keep_raw))
+
+def benchmark_extraction(html_file_path, repeat=5):
+    """
+    对比BeautifulSoup解析与流式解析的耗时，并确认两者输出完全一致
+    """
+    def timed(func):
+        best = None
+        result = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            # 屏蔽提取过程中的进度输出
+            with contextlib.redirect_stdout(io.StringIO()):
+                result = func(html_file_path)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best, result
+
+    soup_time, soup_result = timed(extract_operators_info)
+    stream_time, stream_result = timed(extract_operators_info_streaming)
+
+    assert soup_result == stream_result, "流式解析结果与BeautifulSoup解析结果不一致"
+
+    print(f"干员数量: {len(stream_result)} (两种方式输出一致)")
+    print(f"BeautifulSoup: {soup_time * 1000:.1f} ms")
+    print(f"流式解析:      {stream_time * 1000:.1f} ms")
+    print(f"加速比:        {soup_time / stream_time:.1f}x")
+    return soup_time, stream_time
+
+def benchmark_field_mapping(html_file_path, repeat=200):
+    """
+    微基准：测量 build_operator_info 处理单个干员容器的平均耗时（不含HTML解析）
+    """
+    parser = FilterDataParser()
+    with open(html_file_path, 'r', encoding='utf-8') as file:
+        parser.feed(file.read())
+    records = parser.records
+
+    if not records:
+        print("错误: 没有可用于测试的干员容器")
+        return None
+
+    best = None
+    for _ in range(5):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            for attrs, feature_text in records:
+                build_operator_info(attrs, feature_text)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    per_operator = best / (repeat * len(records))
+    print(f"字段映射: {per_operator * 1e6:.2f} µs/干员 ({len(records)} 个容器 x {repeat} 次)")
+    return per_operator
+
+def write_json_atomic(data, output_file, indent=2):
+    """
+    先写入临时文件再替换，读取方永远不会看到写了一半的文件
+    """
+    temp_file = f"{output_file}.tmp"
+    with open(temp_file, 'w', encoding='utf-8') as file:
+        json.dump(data, file, ensure_ascii=False, indent=indent)
+    os.replace(temp_file, output_file)
+
 def save_operators_to_json(operators_data, output_file='operators_data.json'):
     """
     将干员数据保存为JSON文件
     """
-    with open(output_file, 'w', encoding='utf-8') as file:
-        json.dump(operators_data, file, ensure_ascii=False, indent=2)
+    write_json_atomic(operators_data, output_file)
     
     print(f"干员信息已保存到 {output_file}")
     print(f"共提取了 {len(operators_data)} 个干员的信息")
 
+def operator_content_hash(operator_info):
+    """
+    计算单个干员信息的内容哈希（与字段顺序无关）
+    """
+    data = json.dumps(operator_info, ensure_ascii=False, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()[:16]
+
+def diff_operators(old_operators, new_operators):
+    """
+    按干员姓名对比新旧数据，返回新增、移除和内容变化的干员
+    """
+    old_by_name = {op.get('姓名'): op for op in old_operators}
+    new_by_name = {op.get('姓名'): op for op in new_operators}
+
+    added = [name for name in new_by_name if name not in old_by_name]
+    removed = [name for name in old_by_name if name not in new_by_name]
+
+    changed = []
+    for name, new_op in new_by_name.items():
+        old_op = old_by_name.get(name)
+        if old_op is None or operator_content_hash(old_op) == operator_content_hash(new_op):
+            continue
+        fields = sorted(key for key in set(old_op) | set(new_op) if old_op.get(key) != new_op.get(key))
+        changed.append({'姓名': name, '字段': fields})
+
+    order_changed = (
+        not added and not removed
+        and [op.get('姓名') for op in old_operators] != [op.get('姓名') for op in new_operators]
+    )
+
+    return {'added': added, 'removed': removed, 'changed': changed, 'order_changed': order_changed}
+
+def save_operators_incremental(operators_data, output_file='operators_data.json',
+                               changelog_file='operators_changelog.json'):
+    """
+    与已有的JSON对比后增量保存
+    没有变化时不改动任何文件；有变化时原子地更新数据文件，并写出本次变更记录，
+    供头像下载和服务端缓存只处理变化的干员
+    """
+    old_operators = []
+    if os.path.exists(output_file):
+        try:
+            with open(output_file, 'r', encoding='utf-8') as file:
+                old_operators = json.load(file)
+        except (OSError, ValueError) as e:
+            print(f"警告: 读取已有数据 {output_file} 失败，将全部视为新增: {e}")
+
+    changes = diff_operators(old_operators, operators_data)
+
+    print(f"新增 {len(changes['added'])} 个, 移除 {len(changes['removed'])} 个, "
+          f"变化 {len(changes['changed'])} 个干员")
+    for name in changes['added']:
+        print(f"  + {name}")
+    for name in changes['removed']:
+        print(f"  - {name}")
+    for item in changes['changed']:
+        print(f"  * {item['姓名']}: {', '.join(item['字段'])}")
+
+    if not (changes['added'] or changes['removed'] or changes['changed'] or changes['order_changed']):
+        print(f"干员数据没有变化，未改动 {output_file}")
+        return changes
+
+    save_operators_to_json(operators_data, output_file)
+
+    changelog = {
+        'generated_at': datetime.now().isoformat(timespec='seconds'),
+        **changes,
+        'hashes': {op.get('姓名'): operator_content_hash(op) for op in operators_data},
+    }
+    write_json_atomic(changelog, changelog_file)
+    print(f"变更记录已保存到 {changelog_file}")
+
+    return changes
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="从干员一览页面提取干员信息")
+    parser.add_argument('html_file', nargs='?', default='input.html')
+    parser.add_argument('--mode', choices=['stream', 'soup'], default='stream',
+                        help="stream: 流式解析（默认）; soup: BeautifulSoup完整解析")
+    parser.add_argument('--benchmark', action='store_true', help="对比两种解析方式的耗时和输出")
+    parser.add_argument('--keep-raw', action='store_true', help="数值属性之外同时保留原始字符串（原始{字段名}）")
+    parser.add_argument('--full', action='store_true', help="不做增量对比，直接重写整个JSON文件")
+    args = parser.parse_args()
+    
     # 提取干员信息
-    html_file_path = "input.html"
+    html_file_path = args.html_file
     
     if not os.path.exists(html_file_path):
         print(f"错误: 找不到文件 {html_file_path}")
         exit(1)
     
+    if args.benchmark:
+        benchmark_extraction(html_file_path)
+        benchmark_field_mapping(html_file_path)
+        exit(0)
+    
     print("开始提取干员信息...")
-    operators_data = extract_operators_info(html_file_path)
+    if args.mode == 'stream':
+        operators_data = extract_operators_info_streaming(html_file_path, keep_raw=args.keep_raw)
+    else:
+        operators_data = extract_operators_info(html_file_path, keep_raw=args.keep_raw)
     
     # 保存为JSON
-    save_operators_to_json(operators_data)
+    if args.full:
+        save_operators_to_json(operators_data)
+    else:
+        save_operators_incremental(operators_data)
     
     # 打印示例数据
     if operators_data:
@@ -1,69 +1,84 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, Response
+from fastapi.encoders import jsonable_encoder
+import asyncio
 import json
 import os
-import random
+import re
 import hashlib
-from datetime import datetime
-from typing import List, Dict, Any
+import secrets
+import threading
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from typing import List, Dict, Any, Optional
 from pydantic import BaseModel
+import numpy as np
 
-app = FastAPI(title="明日方舟干员选择游戏")
-
-# 配置CORS
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],  # 在生产环境中应该限制具体域名
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+from avatar_utils import (
+    VARIANTS_FOLDER, VARIANTS_MANIFEST, list_avatar_files, load_avatar_manifest, load_variants_manifest,
+    lookup_avatar_filename
+)
+from avatar_verify import VERIFY_REPORT_FILE, verify_avatars
+from roster_compact import load_roster
+from rooms import PLAYERS, CreationLimiter, RoomError, event_message
+from state_backend import BoardCache, create_backend
+from boards import (
+    BOARD_SIZE, TIME_SEED_TZ, generate_verification_code, get_time_seed, select_filtered_indices
 )
-
-# 静态文件服务
-app.mount("/static", StaticFiles(directory="static"), name="static")
-app.mount("/avatars", StaticFiles(directory="avatars"), name="avatars")
 
 class OperatorResponse(BaseModel):
     operators: List[Dict[str, Any]]
     verification_code: str
     timestamp: str
+    atlas: Optional[Dict[str, Any]] = None
 
-def get_time_seed():
-    """
-    获取基于当前分钟的时间种子
-    同一分钟内返回相同的种子
-    """
-    now = datetime.now()
-    # 使用年月日时分作为种子，忽略秒
-    time_str = now.strftime("%Y%m%d%H%M")
-    return time_str
+class BoardResponse(BaseModel):
+    seed: str
+    roster_version: str
+    operator_ids: List[int]
+    verification_code: str
+
+class RosterResponse(BaseModel):
+    roster_version: str
+    operators: List[Dict[str, Any]]
+
+class RoomCreateRequest(BaseModel):
+    seed: Optional[str] = None
+    filter: Optional[List[str]] = None
+    stat: Optional[List[str]] = None
+
+class RoomResponse(BaseModel):
+    room_id: str
+    seed: str
+    roster_version: str
+    operator_ids: List[int]
+    verification_code: str
 
-def generate_verification_code(operators: List[Dict], time_seed: str) -> str:
+class RoomJoinRequest(BaseModel):
+    role: str
+
+class RoomJoinResponse(BaseModel):
+    room_id: str
+    role: str
+    token: str
+
+def seconds_until_next_minute(now=None) -> int:
     """
-    生成四位校验码
-    基于干员列表和时间种子
+    距离下一分钟（即下一个时间种子）的剩余秒数
     """
-    # 创建一个基于干员名称和时间的字符串
-    operator_names = [op.get('姓名', '') for op in operators]
-    data_str = time_seed + ''.join(sorted(operator_names))
-    
-    # 生成哈希并取前4位
-    hash_obj = hashlib.md5(data_str.encode('utf-8'))
-    hash_hex = hash_obj.hexdigest()
-    
-    # 转换为4位数字码
-    verification_code = str(int(hash_hex[:8], 16))[-4:].zfill(4)
-    return verification_code
+    if now is None:
+        now = datetime.now()
+    return max(1, 60 - now.second)
 
-def load_operators_data():
+def load_operators_data(json_file='operators_data.json', avatars_folder='avatars', variants=None):
     """
     加载干员数据
+    variants为缩略图清单，有对应缩略图的干员头像指向带内容哈希的缩略图
+    头像文件名优先从下载时生成的头像清单中查找
+    json_file 以 .bin 结尾时按 roster_compact 的紧凑格式读取
     """
-    json_file = 'operators_data.json'
-    avatars_folder = 'avatars'
-    
     if not os.path.exists(json_file):
         raise HTTPException(status_code=500, detail="干员数据文件不存在")
     
@@ -71,8 +86,11 @@ def load_operators_data():
         raise HTTPException(status_code=500, detail="头像文件夹不存在")
     
     try:
-        with open(json_file, 'r', encoding='utf-8') as file:
-            operators_data = json.load(file)
+        operators_data = load_roster(json_file)
+        
+        # 一次性列出头像文件夹，避免对每个干员逐个探测文件
+        avatar_files = list_avatar_files(avatars_folder)
+        avatar_manifest = load_avatar_manifest(avatars_folder)
         
         valid_operators = []
         
@@ -81,22 +99,17 @@ def load_operators_data():
             
             if name != 'Unknown':
                 # 检查头像文件是否存在
-                possible_formats = [
-                    f"{name}_头像_{name}.png",
-                    f"头像_{name}.png",
-                    f"{name}.png",
-                    f"{name}_头像.png",
-                ]
+                filename = lookup_avatar_filename(name, avatar_manifest, avatar_files)
                 
-                avatar_url = None
-                for format_name in possible_formats:
-                    file_path = os.path.join(avatars_folder, format_name)
-                    if os.path.exists(file_path):
-                        avatar_url = f"/avatars/{format_name}"
-                        break
-                
-                if avatar_url:
-                    operator['avatar_url'] = avatar_url
+                if filename:
+                    operator['id'] = len(valid_operators)
+                    operator['avatar_file'] = filename
+                    variant = variants.get(filename) if variants else None
+                    if variant:
+                        operator['avatar_url'] = f"/static/avatars_opt/{variant['webp']}"
+                        operator['avatar_png_url'] = f"/static/avatars_opt/{variant['png']}"
+                    else:
+                        operator['avatar_url'] = f"/avatars/{filename}"
                     valid_operators.append(operator)
         
         return valid_operators
@@ -104,6 +117,568 @@ def load_operators_data():
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"加载干员数据时出错: {str(e)}")
 
+# 精简视图中保留的字段，前端展示只需要这些
+SLIM_FIELDS = ('id', '姓名', 'avatar_url', 'avatar_png_url', '职业', '子职业', '稀有度')
+
+def project_operator(operator: Dict[str, Any], fields) -> Dict[str, Any]:
+    """
+    只保留指定字段的干员记录
+    """
+    return {field: operator[field] for field in fields if field in operator}
+
+# 数值筛选支持的比较符
+STAT_COMPARATORS = {
+    '<': np.less,
+    '<=': np.less_equal,
+    '>': np.greater,
+    '>=': np.greater_equal,
+    '==': np.equal,
+    '!=': np.not_equal,
+}
+
+def build_stat_arrays(operators: List[Dict[str, Any]]) -> Dict[str, np.ndarray]:
+    """
+    把名册中的数值字段（生命值、部署费用、攻击间隔等）整理为按名册下标排列的float64数组
+    缺少该字段的干员记为NaN
+    """
+    fields = []
+    for operator in operators:
+        for key, value in operator.items():
+            if key != 'id' and key not in fields and isinstance(value, (int, float)) and not isinstance(value, bool):
+                fields.append(key)
+    
+    stats = {}
+    for key in fields:
+        values = [operator.get(key) for operator in operators]
+        # 同一字段中混有非数值（如旧格式的字符串）时不参与筛选
+        if all(v is None or (isinstance(v, (int, float)) and not isinstance(v, bool)) for v in values):
+            stats[key] = np.array([np.nan if v is None else v for v in values], dtype=np.float64)
+    return stats
+
+def filter_stat_mask(stats: Dict[str, np.ndarray], conditions, roster_size: int) -> np.ndarray:
+    """
+    按数值条件向量化筛选干员，返回布尔掩码
+    conditions为(字段, 比较符, 数值)的列表，例如 [('部署费用', '<=', 15), ('攻击间隔', '<', 1.2)]
+    缺少该字段的干员不满足任何条件
+    """
+    mask = np.ones(roster_size, dtype=bool)
+    for field, comparator, value in conditions:
+        if field not in stats:
+            raise ValueError(f"不支持按字段筛选: {field}")
+        if comparator not in STAT_COMPARATORS:
+            raise ValueError(f"不支持的比较符: {comparator}")
+        column = stats[field]
+        mask &= STAT_COMPARATORS[comparator](column, value) & ~np.isnan(column)
+    return mask
+
+def filter_stat_indices(stats: Dict[str, np.ndarray], conditions, roster_size: int) -> List[int]:
+    """
+    按数值条件筛选干员，返回同时满足所有条件的名册下标
+    """
+    return np.flatnonzero(filter_stat_mask(stats, conditions, roster_size)).tolist()
+
+# 建立倒排索引的属性字段，可在对局接口中按取值筛选
+INDEXED_FIELDS = ('职业', '子职业', '稀有度', '势力', '国家', '小队', '出身地', '种族', '性别', '位置', '标签')
+
+def build_attribute_index(operators: List[Dict[str, Any]]) -> Dict[str, Dict[str, int]]:
+    """
+    建立 字段 -> 取值 -> 干员位集 的倒排索引
+    位集用整数表示，第i位为1表示名册下标为i的干员具有该取值；列表字段（标签）的每一项分别索引
+    数值取值（稀有度）以字符串为键，与查询参数一致
+    """
+    index = {field: {} for field in INDEXED_FIELDS}
+    for i, operator in enumerate(operators):
+        bit = 1 << i
+        for field in INDEXED_FIELDS:
+            value = operator.get(field)
+            if value is None:
+                continue
+            values = index[field]
+            for item in (value if isinstance(value, list) else [value]):
+                key = str(item)
+                values[key] = values.get(key, 0) | bit
+    return index
+
+def mask_to_bitset(mask: np.ndarray) -> int:
+    """
+    把布尔掩码转换为与倒排索引相同的整数位集
+    """
+    return int.from_bytes(np.packbits(mask, bitorder='little').tobytes(), 'little')
+
+def bitset_to_indices(bits: int) -> List[int]:
+    """
+    按从小到大的顺序列出位集中为1的下标
+    """
+    indices = []
+    while bits:
+        lowest = bits & -bits
+        indices.append(lowest.bit_length() - 1)
+        bits ^= lowest
+    return indices
+
+STAT_CONDITION_PATTERN = re.compile(r'^(.+?)(<=|>=|==|!=|<|>)(-?\d+(?:\.\d+)?)$')
+
+def parse_board_filters(attribute_filters: Optional[List[str]] = None,
+                        stat_filters: Optional[List[str]] = None):
+    """
+    解析对局筛选参数，返回规范化（排序后）的条件元组，可直接用作缓存键
+    attribute_filters 形如 "职业:近卫,重装"：同一字段的多个取值为或，不同字段之间为且
+    stat_filters 形如 "部署费用<=15"，多个条件之间为且
+    没有任何筛选条件时返回 None
+    """
+    attributes = {}
+    for item in attribute_filters or []:
+        field, sep, values = item.partition(':')
+        field = field.strip()
+        if not sep or field not in INDEXED_FIELDS:
+            raise ValueError(f"无效的属性筛选: {item}（支持的字段: {'/'.join(INDEXED_FIELDS)}）")
+        choices = {v.strip() for v in values.split(',') if v.strip()}
+        if not choices:
+            raise ValueError(f"属性筛选缺少取值: {item}")
+        # 同一字段出现多次时取交集
+        attributes[field] = attributes[field] & choices if field in attributes else choices
+    
+    stats = []
+    for item in stat_filters or []:
+        match = STAT_CONDITION_PATTERN.match(item.replace(' ', ''))
+        if not match:
+            raise ValueError(f"无效的数值筛选: {item}（示例: 部署费用<=15）")
+        stats.append((match.group(1), match.group(2), float(match.group(3))))
+    
+    if not attributes and not stats:
+        return None
+    return (
+        tuple((field, tuple(sorted(values))) for field, values in sorted(attributes.items())),
+        tuple(sorted(stats)),
+    )
+
+class RosterSnapshot:
+    """
+    一次加载得到的名册及其派生数据（精简记录、数值列、倒排索引、精灵图坐标、版本），创建后不再修改
+    重新加载时整体替换；请求和预生成开始时取一次快照，之后读到的数据总是属于同一份名册
+    """
+    __slots__ = ('operators', 'slim_operators', 'fields', 'stats', 'attribute_index', 'atlas', 'atlas_coords',
+                 'version', 'roster_body', 'reload_count')
+
+    def __init__(self, operators=(), slim_operators=(), stats=None, attribute_index=None, atlas=None,
+                 atlas_coords=(), version='', roster_body=b'', reload_count=0):
+        self.operators: List[Dict[str, Any]] = list(operators)
+        self.slim_operators: List[Dict[str, Any]] = list(slim_operators)
+        # 名册中出现过的所有字段，fields= 只能从中选择
+        self.fields = frozenset(field for operator in self.operators for field in operator)
+        self.stats: Dict[str, np.ndarray] = stats or {}
+        self.attribute_index: Dict[str, Dict[str, int]] = attribute_index or {}
+        self.atlas: Optional[Dict[str, Any]] = atlas
+        self.atlas_coords: List[Optional[List[int]]] = list(atlas_coords)
+        self.version = version
+        self.roster_body = roster_body
+        self.reload_count = reload_count
+
+class RosterStore:
+    """
+    干员名册缓存
+    启动时加载一次，之后仅在数据文件或头像文件夹的修改时间变化时重新加载
+    当前名册保存在 snapshot 中，需要同时使用多项数据时应先通过 get_snapshot() 取得快照
+    """
+    def __init__(self, json_file='operators_data.json', avatars_folder='avatars',
+                 atlas_file=os.path.join('static', 'atlas', 'avatars_atlas.json')):
+        self.json_file = json_file
+        self.avatars_folder = avatars_folder
+        self.atlas_file = atlas_file
+        self.variants_manifest = os.path.join(VARIANTS_FOLDER, VARIANTS_MANIFEST)
+        self.snapshot = RosterSnapshot()
+        self._mtimes = None
+        self._lock = threading.Lock()
+
+    # 单项数据的只读访问，供只用到其中一项的脚本使用
+    operators = property(lambda self: self.snapshot.operators)
+    slim_operators = property(lambda self: self.snapshot.slim_operators)
+    stats = property(lambda self: self.snapshot.stats)
+    attribute_index = property(lambda self: self.snapshot.attribute_index)
+    atlas = property(lambda self: self.snapshot.atlas)
+    atlas_coords = property(lambda self: self.snapshot.atlas_coords)
+    version = property(lambda self: self.snapshot.version)
+    roster_body = property(lambda self: self.snapshot.roster_body)
+    reload_count = property(lambda self: self.snapshot.reload_count)
+
+    def _current_mtimes(self):
+        """
+        获取数据文件和头像文件夹的修改时间，文件缺失时返回None
+        精灵图和缩略图是可选的，未生成时其修改时间记为None
+        """
+        try:
+            mtimes = (os.stat(self.json_file).st_mtime_ns, os.stat(self.avatars_folder).st_mtime_ns)
+        except OSError:
+            return None
+        for optional_file in (self.atlas_file, self.variants_manifest):
+            try:
+                mtimes += (os.stat(optional_file).st_mtime_ns,)
+            except OSError:
+                mtimes += (None,)
+        return mtimes
+
+    def _load_atlas(self, operators):
+        """
+        读取头像精灵图的坐标映射（由 avatar_atlas.py 生成），返回 (精灵图, 按名册下标排列的坐标)
+        不存在时返回 (None, [])，即禁用精灵图
+        """
+        if not os.path.exists(self.atlas_file):
+            return None, []
+        atlas_url = '/static/atlas/'
+        try:
+            with open(self.atlas_file, 'r', encoding='utf-8') as file:
+                atlas_map = json.load(file)
+            atlas = {
+                "tile_size": atlas_map['tile_size'],
+                "width": atlas_map['width'],
+                "height": atlas_map['height'],
+                "images": {fmt: f"{atlas_url}{name}?v={atlas_map['version']}"
+                           for fmt, name in atlas_map['images'].items()},
+            }
+            sprites = atlas_map['sprites']
+            return atlas, [sprites.get(op['avatar_file']) for op in operators]
+        except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+            # 坐标映射损坏（缺少字段等）时同样禁用精灵图，不影响名册加载
+            print(f"警告: 读取头像精灵图失败: {e!r}")
+            return None, []
+
+    def reload(self, mtimes=None):
+        """
+        重新读取干员数据并解析头像路径，构建新的快照后一次性替换
+        """
+        with self._lock:
+            operators = load_operators_data(
+                self.json_file, self.avatars_folder, load_variants_manifest(os.path.dirname(self.variants_manifest))
+            )
+            slim_operators = [project_operator(op, SLIM_FIELDS) for op in operators]
+            atlas, atlas_coords = self._load_atlas(operators)
+            # 名册版本由精简名册的内容决定，各进程加载同一份数据时版本一致
+            slim_json = json.dumps(slim_operators, ensure_ascii=False, separators=(',', ':'))
+            version = hashlib.md5(slim_json.encode('utf-8')).hexdigest()[:12]
+            roster_body = json.dumps(
+                {"roster_version": version, "operators": slim_operators},
+                ensure_ascii=False, separators=(',', ':')
+            ).encode('utf-8')
+            self.snapshot = RosterSnapshot(
+                operators, slim_operators, build_stat_arrays(operators), build_attribute_index(operators),
+                atlas, atlas_coords, version, roster_body, self.snapshot.reload_count + 1
+            )
+            self._mtimes = mtimes if mtimes is not None else self._current_mtimes()
+            return self.snapshot.operators
+
+    def get_snapshot(self) -> RosterSnapshot:
+        """
+        获取当前名册的快照，文件有变化时自动重新加载
+        """
+        mtimes = self._current_mtimes()
+        if mtimes is None or mtimes != self._mtimes:
+            self.reload(mtimes)
+        return self.snapshot
+
+    def get_operators(self) -> List[Dict[str, Any]]:
+        """
+        获取有效干员列表，文件有变化时自动重新加载
+        """
+        return self.get_snapshot().operators
+
+    def filter_indices(self, conditions) -> List[int]:
+        """
+        按数值条件筛选当前名册，返回满足条件的干员下标
+        """
+        snapshot = self.get_snapshot()
+        return filter_stat_indices(snapshot.stats, conditions, len(snapshot.operators))
+
+    def select_candidates(self, filters, snapshot: Optional[RosterSnapshot] = None) -> List[int]:
+        """
+        按 parse_board_filters 解析出的条件筛选名册（默认为当前名册），返回满足条件的干员下标（从小到大）
+        属性条件通过倒排索引的位集求并/交集得到，数值条件在NumPy数组上一次计算
+        """
+        snapshot = snapshot or self.get_snapshot()
+        operators, stats, index = snapshot.operators, snapshot.stats, snapshot.attribute_index
+        attributes, stat_conditions = filters
+        for field, _, _ in stat_conditions:
+            if field not in stats:
+                raise ValueError(f"不支持按字段筛选: {field}（支持的字段: {'/'.join(stats)}）")
+        
+        bits = (1 << len(operators)) - 1
+        for field, values in attributes:
+            field_bits = 0
+            for value in values:
+                field_bits |= index[field].get(value, 0)
+            bits &= field_bits
+        if stat_conditions and bits:
+            bits &= mask_to_bitset(filter_stat_mask(stats, stat_conditions, len(operators)))
+        return bitset_to_indices(bits)
+
+roster_store = RosterStore()
+
+# 容纳后台预生成的之后几分钟的对局（每分钟最多4种视图组合）
+board_cache = BoardCache(max_entries=64)
+# 按种子生成的对局和对局房间，多worker部署时可配置为共享的Redis
+state_backend = create_backend()
+
+# 清理过期房间的间隔（秒），同时为仍有连接的房间和座位续期，需小于 rooms.SEAT_TTL
+ROOM_EVICT_INTERVAL = 60
+# 按客户端限制创建房间的频率
+room_creation_limiter = CreationLimiter()
+
+# 显式种子的长度上限
+MAX_SEED_LENGTH = 64
+
+def check_candidate_count(candidates: Optional[List[int]]):
+    """
+    筛选后的干员不足一局时返回400
+    """
+    if candidates is not None and len(candidates) < BOARD_SIZE:
+        raise HTTPException(
+            status_code=400,
+            detail=f"筛选后的干员数量不足，需要{BOARD_SIZE}个，当前只有{len(candidates)}个"
+        )
+
+def select_board_candidates(board_filters, snapshot: RosterSnapshot) -> Optional[List[int]]:
+    """
+    按筛选条件从名册快照中选出候选干员下标，没有筛选条件时返回None
+    条件中的字段名册中不存在或候选不足一局时返回400
+    """
+    if not board_filters:
+        return None
+    try:
+        candidates = roster_store.select_candidates(board_filters, snapshot)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    check_candidate_count(candidates)
+    return candidates
+
+def build_board_response(valid_operators: List[Dict[str, Any]], time_seed: str,
+                         view_operators: Optional[List[Dict[str, Any]]] = None, fields=None,
+                         atlas: Optional[Dict[str, Any]] = None, atlas_coords=None,
+                         candidates: Optional[List[int]] = None, roster_version: str = ''):
+    """
+    根据时间种子生成对局，返回序列化后的响应体和ETag
+    view_operators为与名册一一对应的精简记录，fields为需要返回的字段
+    传入atlas时为每个干员附带其在头像精灵图中的坐标
+    candidates为筛选后的候选干员下标，为None时从全部干员中选择
+    """
+    if len(valid_operators) < BOARD_SIZE:
+        raise HTTPException(
+            status_code=500, 
+            detail=f"有效干员数量不足，需要{BOARD_SIZE}个，当前只有{len(valid_operators)}个"
+        )
+    
+    # 选择30个干员
+    selected_indices = select_filtered_indices(len(valid_operators), time_seed, candidates)
+    selected_operators = [valid_operators[i] for i in selected_indices]
+    
+    # 生成校验码
+    verification_code = generate_verification_code(selected_indices, time_seed, roster_version)
+    
+    # 按请求的视图裁剪返回的干员记录
+    if fields:
+        selected_operators = [project_operator(op, fields) for op in selected_operators]
+    elif view_operators is not None:
+        selected_operators = [view_operators[i] for i in selected_indices]
+    
+    if atlas is not None:
+        selected_operators = [
+            dict(op, avatar_atlas=atlas_coords[i])
+            for op, i in zip(selected_operators, selected_indices)
+        ]
+    
+    # 时间戳由种子推出，保证同一分钟内缓存的响应一致
+    current_time = datetime.strptime(time_seed, "%Y%m%d%H%M").strftime("%Y-%m-%d %H:%M")
+    
+    board = OperatorResponse(
+        operators=selected_operators,
+        verification_code=verification_code,
+        timestamp=current_time,
+        atlas=atlas
+    )
+    body = json.dumps(jsonable_encoder(board, exclude_none=True), ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    etag = f'"{time_seed}-{hashlib.md5(body).hexdigest()[:16]}"'
+    return body, etag
+
+def build_seed_board_response(roster_size: int, seed: str, roster_version: str,
+                              candidates: Optional[List[int]] = None):
+    """
+    生成按种子寻址的对局（只含干员id），返回序列化后的响应体和ETag
+    """
+    operator_ids = select_filtered_indices(roster_size, seed, candidates)
+    board = BoardResponse(
+        seed=seed,
+        roster_version=roster_version,
+        operator_ids=operator_ids,
+        verification_code=generate_verification_code(operator_ids, seed, roster_version),
+    )
+    body = json.dumps(jsonable_encoder(board), ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    return body, f'"{roster_version}-{hashlib.md5(body).hexdigest()[:16]}"'
+
+def board_cache_key(snapshot: RosterSnapshot, time_seed: str, view: str, field_list, use_atlas: bool, board_filters):
+    """
+    按时间种子由名册快照生成的对局在 board_cache 中的键
+    """
+    return (time_seed, snapshot.reload_count, view, field_list, use_atlas, board_filters)
+
+# 后台预生成当前之后的分钟数
+PREGENERATE_MINUTES = 5
+
+def prewarm_boards(now=None, minutes: int = PREGENERATE_MINUTES) -> int:
+    """
+    预先生成当前及之后minutes分钟的对局响应放入缓存（完整/精简视图，精灵图已生成时也包括精灵图模式），
+    避免每分钟第一个请求承担生成的开销，返回新生成的数量
+    """
+    if now is None:
+        now = datetime.now(TIME_SEED_TZ)
+    snapshot = roster_store.get_snapshot()
+    current_seed = get_time_seed(now)
+    atlas_modes = (False, True) if snapshot.atlas is not None else (False,)
+    
+    created = 0
+    for offset in range(minutes + 1):
+        time_seed = get_time_seed(now + timedelta(minutes=offset))
+        for view in ("full", "slim"):
+            for use_atlas in atlas_modes:
+                cache_key = board_cache_key(snapshot, time_seed, view, None, use_atlas, None)
+                if cache_key in board_cache:
+                    continue
+                entry = build_board_response(
+                    snapshot.operators, time_seed,
+                    snapshot.slim_operators if view == "slim" else None, None,
+                    snapshot.atlas if use_atlas else None, snapshot.atlas_coords,
+                    None, snapshot.version
+                )
+                board_cache.put(cache_key, entry, current_seed)
+                created += 1
+    return created
+
+async def prewarm_boards_periodically():
+    """
+    每分钟开始时预生成之后几分钟的对局
+    单次失败只记录日志，不会结束后台任务
+    """
+    while True:
+        try:
+            await asyncio.to_thread(prewarm_boards)
+        except HTTPException as e:
+            print(f"警告: 预生成对局失败: {e.detail}")
+        except Exception as e:
+            print(f"警告: 预生成对局失败: {e!r}")
+        await asyncio.sleep(seconds_until_next_minute())
+
+# 最近一次的头像校验报告，健康检查据此判断服务是否就绪
+avatar_report: Dict[str, Any] = {}
+# 生成该报告时名册文件和头像文件夹的修改时间
+avatar_report_mtimes = None
+avatar_check_lock = asyncio.Lock()
+
+def avatar_source_mtimes():
+    """
+    名册文件和头像文件夹的修改时间（头像的增删和下载器的原子替换都会改变文件夹的修改时间），文件缺失时返回None
+    """
+    try:
+        return (os.stat(roster_store.json_file).st_mtime_ns, os.stat(roster_store.avatars_folder).st_mtime_ns)
+    except OSError:
+        return None
+
+def check_avatars_ready() -> bool:
+    """
+    校验头像文件夹并记录报告，返回头像是否就绪
+    """
+    global avatar_report, avatar_report_mtimes
+    # 先记录修改时间，校验期间发生的变化会在下次检查时触发重新校验
+    avatar_report_mtimes = avatar_source_mtimes()
+    try:
+        avatar_report = verify_avatars(roster_store.json_file, roster_store.avatars_folder,
+                                       report_file=VERIFY_REPORT_FILE)
+    except Exception as e:
+        avatar_report = {"ok": False, "error": str(e)}
+    if not avatar_report["ok"]:
+        print(f"警告: 头像未就绪，详见 {VERIFY_REPORT_FILE}")
+    return avatar_report["ok"]
+
+# 检查头像文件夹是否有变化的间隔（秒）
+AVATAR_CHECK_INTERVAL = 60
+
+async def refresh_avatar_report():
+    """
+    名册或头像文件夹在上次校验后有变化时重新校验（与名册的自动重新加载对应），不必重启服务即可恢复就绪
+    """
+    if avatar_source_mtimes() == avatar_report_mtimes:
+        return
+    async with avatar_check_lock:
+        if avatar_source_mtimes() != avatar_report_mtimes:
+            await asyncio.to_thread(check_avatars_ready)
+
+async def refresh_avatars_periodically():
+    """
+    定期检查头像文件夹，有变化时重新校验；与预生成分开运行，任何一方出错都不影响另一方
+    """
+    while True:
+        await asyncio.sleep(AVATAR_CHECK_INTERVAL)
+        try:
+            await refresh_avatar_report()
+        except Exception as e:
+            print(f"警告: 重新校验头像失败: {e!r}")
+
+async def evict_rooms_periodically():
+    """
+    定期清理超过TTL没有活动的房间
+    """
+    while True:
+        await asyncio.sleep(ROOM_EVICT_INTERVAL)
+        await state_backend.evict_expired()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    启动时预先加载干员名册并校验头像
+    """
+    try:
+        roster_store.reload()
+    except HTTPException as e:
+        # 数据缺失时不阻止启动，请求时会再次尝试加载并返回错误
+        print(f"警告: 启动时加载干员名册失败: {e.detail}")
+    check_avatars_ready()
+    await state_backend.start()
+    evictor = asyncio.ensure_future(evict_rooms_periodically())
+    prewarmer = asyncio.ensure_future(prewarm_boards_periodically())
+    avatar_checker = asyncio.ensure_future(refresh_avatars_periodically())
+    yield
+    avatar_checker.cancel()
+    prewarmer.cancel()
+    evictor.cancel()
+    await state_backend.close()
+
+app = FastAPI(title="明日方舟干员选择游戏", lifespan=lifespan)
+
+# 配置CORS
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],  # 在生产环境中应该限制具体域名
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+
+class ImmutableStaticFiles(StaticFiles):
+    """
+    文件名带内容哈希的缩略图，内容变化时URL也会变化，允许浏览器永久缓存
+    同一文件夹中的清单等其他文件会随重新生成而变化，不加永久缓存头
+    """
+    IMMUTABLE_SUFFIXES = ('.webp', '.png')
+
+    def file_response(self, full_path, *args, **kwargs):
+        response = super().file_response(full_path, *args, **kwargs)
+        if str(full_path).endswith(self.IMMUTABLE_SUFFIXES):
+            response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+        else:
+            response.headers["Cache-Control"] = "no-cache"
+        return response
+
+# 静态文件服务（缩略图需在 /static 之前挂载才能优先匹配）
+app.mount("/static/avatars_opt", ImmutableStaticFiles(directory=VARIANTS_FOLDER, check_dir=False), name="avatars_opt")
+app.mount("/static", StaticFiles(directory="static"), name="static")
+app.mount("/avatars", StaticFiles(directory="avatars"), name="avatars")
+
 @app.get("/")
 async def read_root():
     """
@@ -112,51 +687,327 @@ async def read_root():
     return FileResponse('static/index.html')
 
 @app.get("/api/operators", response_model=OperatorResponse)
-async def get_operators():
+async def get_operators(request: Request, view: str = "full", fields: Optional[str] = None,
+                        avatars: str = "url", filter: Optional[List[str]] = Query(None),
+                        stat: Optional[List[str]] = Query(None)):
     """
     获取干员列表
     基于当前时间分钟生成固定的30个干员
+    view=slim 只返回展示所需的字段，fields=姓名,职业 返回指定字段
+    avatars=atlas 返回头像精灵图及每个干员的坐标（精灵图未生成时仍返回单独的头像URL）
+    filter=职业:近卫,重装 与 stat=部署费用<=15 只从满足条件的干员中选择（均可重复传入）
     """
+    if view not in ("full", "slim"):
+        raise HTTPException(status_code=400, detail=f"不支持的视图: {view}")
+    if avatars not in ("url", "atlas"):
+        raise HTTPException(status_code=400, detail=f"不支持的头像模式: {avatars}")
+    field_list = tuple(f for f in fields.split(',') if f) if fields else None
+    try:
+        board_filters = parse_board_filters(filter, stat)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
     try:
         # 获取时间种子
-        time_seed = get_time_seed()
+        now = datetime.now(TIME_SEED_TZ)
+        time_seed = get_time_seed(now)
         
-        # 加载所有有效干员
-        valid_operators = load_operators_data()
+        # 取一次名册快照，本次请求用到的干员、精简记录和精灵图坐标都来自同一份名册
+        snapshot = roster_store.get_snapshot()
         
-        if len(valid_operators) < 30:
-            raise HTTPException(
-                status_code=500, 
-                detail=f"有效干员数量不足，需要30个，当前只有{len(valid_operators)}个"
+        # 未知字段会得到空记录并占用缓存，直接拒绝
+        unknown_fields = [f for f in field_list or () if f not in snapshot.fields]
+        if unknown_fields:
+            raise HTTPException(status_code=400, detail=f"不支持的字段: {','.join(unknown_fields)}")
+        
+        view_operators = snapshot.slim_operators if view == "slim" else None
+        atlas = snapshot.atlas if avatars == "atlas" else None
+        
+        # 同一分钟内的请求直接复用序列化好的响应
+        cache_key = board_cache_key(snapshot, time_seed, view, field_list, atlas is not None, board_filters)
+        entry = board_cache.get(cache_key)
+        if entry is None:
+            candidates = select_board_candidates(board_filters, snapshot)
+            entry = build_board_response(
+                snapshot.operators, time_seed, view_operators, field_list,
+                atlas, snapshot.atlas_coords, candidates, snapshot.version
             )
+            board_cache.put(cache_key, entry, time_seed)
+        body, etag = entry
         
-        # 使用时间种子设置随机数种子
-        random.seed(time_seed)
+        # 允许浏览器和反向代理缓存到本分钟结束
+        headers = {
+            "ETag": etag,
+            "Cache-Control": f"public, max-age={seconds_until_next_minute(now)}",
+        }
+        if request.headers.get("if-none-match") == etag:
+            return Response(status_code=304, headers=headers)
         
-        # 选择30个干员
-        selected_operators = random.sample(valid_operators, 30)
+        return Response(content=body, media_type="application/json", headers=headers)
         
-        # 生成校验码
-        verification_code = generate_verification_code(selected_operators, time_seed)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"获取干员列表时出错: {str(e)}")
+
+def versioned_cache_control(requested_version: Optional[str], roster_version: str) -> str:
+    """
+    依赖名册版本的响应的缓存策略
+    地址中带有当前名册版本（?v=）时内容不会再变化，可长期缓存；否则每次都需用ETag向服务端确认
+    """
+    if requested_version == roster_version:
+        return "public, max-age=86400"
+    return "no-cache"
+
+@app.get("/api/roster", response_model=RosterResponse)
+async def get_roster(request: Request, v: Optional[str] = None):
+    """
+    获取精简名册
+    干员的id即对局接口中使用的整数下标
+    v 为期望的名册版本，与当前版本一致时响应可被长期缓存
+    """
+    snapshot = roster_store.get_snapshot()
+    etag = f'"{snapshot.version}"'
+    headers = {"ETag": etag, "Cache-Control": versioned_cache_control(v, snapshot.version)}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(content=snapshot.roster_body, media_type="application/json", headers=headers)
+
+@app.get("/api/boards/{seed}", response_model=BoardResponse)
+async def get_board(seed: str, request: Request, filter: Optional[List[str]] = Query(None),
+                    stat: Optional[List[str]] = Query(None), v: Optional[str] = None):
+    """
+    根据显式种子获取对局
+    只返回干员在名册中的id，结果只取决于种子、筛选条件和名册版本
+    v 为客户端持有的名册版本，与当前版本一致时可被CDN长期缓存；名册更新后旧地址返回的仍是当前版本的对局
+    filter/stat 的用法与 /api/operators 相同
+    """
+    if not seed or len(seed) > MAX_SEED_LENGTH:
+        raise HTTPException(status_code=400, detail=f"种子长度需在1到{MAX_SEED_LENGTH}之间")
+    try:
+        board_filters = parse_board_filters(filter, stat)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    try:
+        snapshot = roster_store.get_snapshot()
+        valid_operators = snapshot.operators
+        if len(valid_operators) < BOARD_SIZE:
+            raise HTTPException(
+                status_code=500, 
+                detail=f"有效干员数量不足，需要{BOARD_SIZE}个，当前只有{len(valid_operators)}个"
+            )
         
-        # 获取当前时间戳
-        current_time = datetime.now().strftime("%Y-%m-%d %H:%M")
+        cache_key = json.dumps([seed, snapshot.version, board_filters], ensure_ascii=False)
+        entry = await state_backend.get_board(cache_key)
+        if entry is None:
+            candidates = select_board_candidates(board_filters, snapshot)
+            entry = build_seed_board_response(len(valid_operators), seed, snapshot.version, candidates)
+            await state_backend.put_board(cache_key, entry)
+        body, etag = entry
         
-        return OperatorResponse(
-            operators=selected_operators,
-            verification_code=verification_code,
-            timestamp=current_time
-        )
+        headers = {"ETag": etag, "Cache-Control": versioned_cache_control(v, snapshot.version)}
+        if request.headers.get("if-none-match") == etag:
+            return Response(status_code=304, headers=headers)
+        return Response(content=body, media_type="application/json", headers=headers)
         
+    except HTTPException:
+        raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"获取干员列表时出错: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"获取对局时出错: {str(e)}")
+
+@app.post("/api/rooms", response_model=RoomResponse)
+async def create_room(request: RoomCreateRequest, http_request: Request):
+    """
+    创建对局房间
+    房间绑定一个种子（未指定时随机生成）和可选的筛选条件，对局与 /api/boards/{seed} 相同
+    每个客户端一段时间内创建的房间数有上限，超过时返回429
+    """
+    client = http_request.client.host if http_request.client else ""
+    if not room_creation_limiter.allow(client):
+        raise HTTPException(status_code=429, detail="创建房间过于频繁，请稍后再试")
+    seed = request.seed or secrets.token_urlsafe(8)
+    if len(seed) > MAX_SEED_LENGTH:
+        raise HTTPException(status_code=400, detail=f"种子长度需在1到{MAX_SEED_LENGTH}之间")
+    try:
+        board_filters = parse_board_filters(request.filter, request.stat)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    snapshot = roster_store.get_snapshot()
+    valid_operators = snapshot.operators
+    if len(valid_operators) < BOARD_SIZE:
+        raise HTTPException(
+            status_code=500, 
+            detail=f"有效干员数量不足，需要{BOARD_SIZE}个，当前只有{len(valid_operators)}个"
+        )
+    candidates = select_board_candidates(board_filters, snapshot)
+    operator_ids = select_filtered_indices(len(valid_operators), seed, candidates)
+    
+    try:
+        room = await state_backend.create_room(seed, operator_ids, snapshot.version)
+    except RoomError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return RoomResponse(
+        room_id=room.room_id,
+        seed=seed,
+        roster_version=room.roster_version,
+        operator_ids=operator_ids,
+        verification_code=generate_verification_code(operator_ids, seed, room.roster_version),
+    )
+
+@app.get("/api/rooms/{room_id}")
+async def get_room(room_id: str):
+    """
+    获取房间的完整状态（与观战者看到的相同，不含双方选定的干员）
+    """
+    room = await state_backend.get_room(room_id)
+    if room is None:
+        raise HTTPException(status_code=404, detail="房间不存在或已过期")
+    return room.snapshot(connections=state_backend.fanout.count(room_id))
+
+@app.post("/api/rooms/{room_id}/join", response_model=RoomJoinResponse)
+async def join_room(room_id: str, request: RoomJoinRequest):
+    """
+    加入房间的A或B座位，返回连接 /ws/rooms/{room_id} 时需要携带的座位令牌
+    每个座位只发放一次令牌，已有玩家的座位返回409
+    """
+    if request.role not in PLAYERS:
+        raise HTTPException(status_code=400, detail=f"座位需为 {'/'.join(PLAYERS)}")
+    try:
+        token = await state_backend.join(room_id, request.role)
+    except RoomError as e:
+        if await state_backend.get_room(room_id) is None:
+            raise HTTPException(status_code=404, detail=str(e))
+        raise HTTPException(status_code=409, detail=str(e))
+    return RoomJoinResponse(room_id=room_id, role=request.role, token=token)
+
+async def send_room_snapshot(websocket: WebSocket, room_id: str, role: str) -> int:
+    """
+    发送房间的完整状态，返回其中的序号；房间已过期时关闭连接并返回None
+    """
+    room = await state_backend.get_room(room_id)
+    if room is None:
+        await websocket.close(code=4404)
+        return None
+    await websocket.send_json(room.snapshot(role, state_backend.fanout.count(room_id)))
+    return room.seq
+
+async def send_room_messages(websocket: WebSocket, room_id: str, queue, role: str, last_seq: int):
+    """
+    连接的唯一发送方：依次发送队列中的事件，收到None（积压过多）时改发完整状态
+    已包含在之前发送的状态中的事件（序号不大于last_seq）会被跳过
+    """
+    while True:
+        item = await queue.get()
+        if item is None:
+            last_seq = await send_room_snapshot(websocket, room_id, role)
+            if last_seq is None:
+                return
+            continue
+        if isinstance(item, tuple):
+            if item[0] <= last_seq:
+                continue
+            last_seq = item[0]
+            message = event_message(item, role)
+        else:
+            message = item
+        await websocket.send_json(message)
+
+@app.websocket("/ws/rooms/{room_id}")
+async def room_socket(websocket: WebSocket, room_id: str, role: str = "spectator",
+                      token: Optional[str] = None, since: Optional[int] = None):
+    """
+    房间的WebSocket通道
+    role 为 A/B（玩家）或 spectator（观战，只接收）；since 为断线前收到的最后序号，可补发之后的事件
+    玩家需携带加入房间时得到的 token（无效时以4401关闭），每个座位同时只能有一个连接（已占用时以4409关闭）
+    连接后先收到完整状态（或补发的事件），之后收到每个带序号的事件，对方选定的干员不会被发送；
+    玩家发送 {"type": "exclude"|"include"|"select", "operator_id": 干员id} 操作
+    其他worker上的连接产生的事件由存储后端转发
+    """
+    await websocket.accept()
+    if role not in PLAYERS and role != "spectator":
+        await websocket.close(code=4400)
+        return
+    try:
+        # 先订阅再读取状态，读取期间产生的事件不会丢失，重复的由序号过滤
+        queue = state_backend.subscribe(room_id)
+    except RoomError:
+        await websocket.close(code=4429)
+        return
+    
+    sender = None
+    seat_claimed = False
+    try:
+        room = await state_backend.get_room(room_id)
+        if room is None:
+            await websocket.close(code=4404)
+            return
+        if role in PLAYERS:
+            if not room.check_token(role, token):
+                await websocket.close(code=4401)
+                return
+            seat_claimed = await state_backend.claim_seat(room_id, role)
+            if not seat_claimed:
+                await websocket.close(code=4409)
+                return
+        missed = room.events_since(since) if since is not None else None
+        if missed is None:
+            await websocket.send_json(room.snapshot(role, state_backend.fanout.count(room_id)))
+        else:
+            for event in missed:
+                await websocket.send_json(event_message(event, role))
+        sender = asyncio.ensure_future(send_room_messages(websocket, room_id, queue, role, room.seq))
+        
+        while True:
+            try:
+                message = await websocket.receive_json()
+                await state_backend.apply(room_id, role, message.get("type"), message.get("operator_id"))
+            except (RoomError, ValueError, AttributeError) as e:
+                # 错误只发给当前连接，经由发送队列保证消息不交错
+                if not queue.full():
+                    queue.put_nowait({"type": "error", "detail": str(e)})
+    except WebSocketDisconnect:
+        pass
+    finally:
+        state_backend.unsubscribe(room_id, queue)
+        if sender is not None:
+            sender.cancel()
+        if seat_claimed:
+            await state_backend.release_seat(room_id, role)
 
 @app.get("/api/health")
 async def health_check():
     """
     健康检查接口
+    头像校验未通过时状态为 degraded，并返回 503 以便负载均衡等待就绪；头像文件夹变化后会重新校验
     """
-    return {"status": "healthy", "timestamp": datetime.now().isoformat()}
+    await refresh_avatar_report()
+    ready = bool(avatar_report.get("ok"))
+    snapshot = roster_store.snapshot
+    body = {
+        "status": "healthy" if ready else "degraded",
+        "timestamp": datetime.now().isoformat(),
+        "operators": len(snapshot.operators),
+        "roster_version": snapshot.version,
+        "roster_reloads": snapshot.reload_count,
+        "board_cache": {"entries": len(board_cache), "hits": board_cache.hits, "misses": board_cache.misses},
+        "rooms": {"backend": state_backend.name, "active": await state_backend.room_count()},
+        "avatars": {
+            "ok": ready,
+            "checked_at": avatar_report.get("checked_at"),
+            "files": avatar_report.get("files", 0),
+            "usable": avatar_report.get("usable", 0),
+            "invalid": len(avatar_report.get("invalid", [])),
+            "duplicates": len(avatar_report.get("duplicates", [])),
+            "missing": len(avatar_report.get("missing", [])),
+            "orphaned": len(avatar_report.get("orphaned", [])),
+        },
+    }
+    if not ready:
+        return Response(content=json.dumps(body, ensure_ascii=False), status_code=503,
+                        media_type="application/json")
+    return body
 
 if __name__ == "__main__":
     import uvicorn
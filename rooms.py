@@ -0,0 +1,203 @@
+"""
+对局房间
+房间绑定一个对局种子，记录双方排除/选定的干员，每个事件带有房间内递增的序号
+玩家通过加入房间取得所在座位的令牌，凭令牌连接并操作，每个座位只发放一次令牌
+房间的保存和事件的广播由 state_backend 中的存储后端负责
+"""
+
+import secrets
+import time
+from collections import deque
+
+ROOM_TTL = 3600
+# 还没有玩家加入的房间的保留时间，避免只创建不使用的房间占满上限
+UNJOINED_ROOM_TTL = 300
+MAX_ROOMS = 10000
+# 每个客户端在 ROOM_CREATE_WINDOW 秒内最多创建的房间数
+MAX_ROOMS_PER_CLIENT = 10
+ROOM_CREATE_WINDOW = 600
+# 座位被连接占用的时长（秒），由存储后端定期续期，worker异常退出后座位在此之后释放
+SEAT_TTL = 120
+# 每个房间保留的最近事件数，断线重连时据此补发
+MAX_EVENTS = 256
+# 每个房间的连接数上限（双方玩家和观战者）
+MAX_CONNECTIONS = 16
+# 每个连接待发送事件的上限，积压超过上限时改为发送一次完整状态
+QUEUE_SIZE = 64
+
+PLAYERS = ('A', 'B')
+EVENT_TYPES = ('exclude', 'include', 'select')
+
+
+class RoomError(Exception):
+    """
+    房间操作不合法，例如重复选定、干员不在本局中、房间已满
+    """
+
+
+class CreationLimiter:
+    """
+    按客户端统计一段时间内创建的房间数（只统计当前进程）
+    """
+    def __init__(self, limit=MAX_ROOMS_PER_CLIENT, window=ROOM_CREATE_WINDOW):
+        self.limit = limit
+        self.window = window
+        self._created = {}
+
+    def allow(self, client, now=None):
+        """
+        客户端未超过上限时记录一次创建并返回True
+        """
+        now = time.monotonic() if now is None else now
+        for key in [key for key, times in self._created.items() if now - times[-1] > self.window]:
+            del self._created[key]
+        times = self._created.setdefault(client, deque())
+        while times and now - times[0] > self.window:
+            times.popleft()
+        if len(times) >= self.limit:
+            return False
+        times.append(now)
+        return True
+
+
+def event_message(event, viewer=None):
+    """
+    把事件元组 (序号, 类型, 玩家, 干员id) 转换为发送给viewer的消息
+    选定的干员是留给对方猜的，只发给选定者本人，其他连接只知道已经选定
+    """
+    seq, event_type, player, operator_id = event
+    if event_type == 'select' and viewer != player:
+        operator_id = None
+    return {"type": event_type, "seq": seq, "player": player, "operator_id": operator_id}
+
+
+class Room:
+    """
+    一个对局房间的状态
+    excluded/selected 按玩家记录排除和选定的干员id，tokens 为各座位的令牌（未加入时为None），
+    events 以元组保存最近的事件
+    """
+    __slots__ = ('room_id', 'seed', 'operator_ids', 'roster_version', 'excluded', 'selected', 'tokens',
+                 'seq', 'events', 'created_at', 'touched_at')
+
+    def __init__(self, room_id, seed, operator_ids, roster_version, now):
+        self.room_id = room_id
+        self.seed = seed
+        self.operator_ids = tuple(operator_ids)
+        self.roster_version = roster_version
+        self.excluded = {player: set() for player in PLAYERS}
+        self.selected = {player: None for player in PLAYERS}
+        self.tokens = {player: None for player in PLAYERS}
+        self.seq = 0
+        self.events = deque(maxlen=MAX_EVENTS)
+        self.created_at = now
+        self.touched_at = now
+
+    def to_state(self):
+        """
+        可JSON序列化的房间状态，供需要序列化的存储后端使用（不含只在单个进程中有意义的时间）
+        """
+        return {
+            "room_id": self.room_id,
+            "seed": self.seed,
+            "operator_ids": list(self.operator_ids),
+            "roster_version": self.roster_version,
+            "excluded": {player: sorted(ids) for player, ids in self.excluded.items()},
+            "selected": self.selected,
+            "tokens": self.tokens,
+            "seq": self.seq,
+            "events": [list(event) for event in self.events],
+        }
+
+    @classmethod
+    def from_state(cls, state, now=None):
+        room = cls(state["room_id"], state["seed"], state["operator_ids"], state["roster_version"],
+                   time.monotonic() if now is None else now)
+        room.excluded = {player: set(ids) for player, ids in state["excluded"].items()}
+        room.selected = dict(state["selected"])
+        room.tokens.update(state.get("tokens", {}))
+        room.seq = state["seq"]
+        room.events.extend(tuple(event) for event in state["events"])
+        return room
+
+    def snapshot(self, viewer=None, connections=0):
+        """
+        房间对viewer可见的完整状态，新连接和积压过多的连接会收到它
+        其他玩家选定的干员只显示是否已选定，joined 表示座位是否已有玩家加入
+        """
+        return {
+            "type": "snapshot",
+            "room_id": self.room_id,
+            "seed": self.seed,
+            "roster_version": self.roster_version,
+            "operator_ids": list(self.operator_ids),
+            "seq": self.seq,
+            "players": {
+                player: {
+                    "excluded": sorted(self.excluded[player]),
+                    "selected": self.selected[player] if player == viewer else self.selected[player] is not None,
+                    "joined": self.tokens[player] is not None,
+                }
+                for player in PLAYERS
+            },
+            "connections": connections,
+        }
+
+    @property
+    def joined(self):
+        return any(token is not None for token in self.tokens.values())
+
+    def join(self, player, now=None):
+        """
+        加入player的座位并返回该座位的令牌，座位已有玩家时拒绝
+        """
+        if player not in PLAYERS:
+            raise RoomError(f"没有这个座位: {player}")
+        if self.tokens[player] is not None:
+            raise RoomError("该座位已有玩家")
+        token = secrets.token_urlsafe(16)
+        self.tokens[player] = token
+        self.touched_at = time.monotonic() if now is None else now
+        return token
+
+    def check_token(self, player, token):
+        """
+        token是否为player座位的令牌
+        """
+        expected = self.tokens.get(player)
+        return expected is not None and isinstance(token, str) and secrets.compare_digest(expected, token)
+
+    def apply(self, player, event_type, operator_id, now=None):
+        """
+        应用一个玩家事件并分配序号，返回事件元组
+        """
+        if player not in PLAYERS:
+            raise RoomError(f"观战者不能操作: {player}")
+        if event_type not in EVENT_TYPES:
+            raise RoomError(f"不支持的事件: {event_type}")
+        if operator_id not in self.operator_ids:
+            raise RoomError(f"干员不在本局中: {operator_id}")
+
+        if event_type == 'select':
+            # 选定在一局中不可逆
+            if self.selected[player] is not None:
+                raise RoomError("本局已经选定过干员")
+            self.selected[player] = operator_id
+        elif event_type == 'exclude':
+            self.excluded[player].add(operator_id)
+        else:
+            self.excluded[player].discard(operator_id)
+
+        self.seq += 1
+        self.touched_at = time.monotonic() if now is None else now
+        event = (self.seq, event_type, player, operator_id)
+        self.events.append(event)
+        return event
+
+    def events_since(self, seq):
+        """
+        序号大于seq的事件；所需事件已不在保留范围内时返回None，调用方应改为发送完整状态
+        """
+        if seq > self.seq or seq < self.seq - len(self.events):
+            return None
+        return list(self.events)[len(self.events) - (self.seq - seq):]
@@ -0,0 +1,413 @@
+"""
+干员名册的紧凑二进制格式
+按列存储：文本字段驻留为字符串表中的下标，数值字段存为int32/float64数组，标签等列表字段存为下标区间
+读取时用mmap映射整个文件，OperatorRecord 只在访问某个字段时才解码对应的文本
+"""
+
+import argparse
+import json
+import mmap
+import os
+import struct
+import sys
+import time
+import tracemalloc
+from array import array
+from contextlib import contextmanager
+
+COMPACT_MAGIC = b'AKRC'
+COMPACT_VERSION = 2
+COMPACT_SUFFIX = '.bin'
+COMPACT_FILE = 'operators_data' + COMPACT_SUFFIX
+
+# 文件头: 魔数、版本号、描述信息(JSON)的长度
+HEADER_STRUCT = struct.Struct('<4sH2xI')
+
+MISSING_INDEX = 0xFFFFFFFF
+MISSING_INT = -2 ** 31
+MISSING_FLOAT = float('nan')
+
+# 字段缺失的标记（与值为None区分）
+_MISSING = object()
+
+
+def column_order(operators):
+    """
+    合并所有干员的字段顺序，缺少某些字段（如小队）的干员不会打乱其他字段的相对顺序
+    """
+    order = []
+    for operator in operators:
+        position = 0
+        for key in operator:
+            if key not in order:
+                order.insert(position, key)
+            position = order.index(key) + 1
+    return order
+
+
+def is_int32_text(value):
+    """
+    字符串能否无损地存为int32（转换回字符串后与原值完全一致）
+    """
+    try:
+        number = int(value)
+    except ValueError:
+        return False
+    return str(number) == value and MISSING_INT < number < 2 ** 31
+
+
+def column_kind(name, values):
+    """
+    根据一列的取值决定存储方式: str / int_text / int / float / list
+    """
+    present = [v for v in values if v is not _MISSING]
+    if all(isinstance(v, list) and all(isinstance(item, str) for item in v) for v in present):
+        return 'list'
+    if present and all(type(v) is int and MISSING_INT < v < 2 ** 31 for v in present):
+        return 'int'
+    if present and all(type(v) is float and v == v for v in present):
+        return 'float'
+    if not all(isinstance(v, str) for v in present):
+        raise ValueError(f"字段 {name} 的值类型不受支持")
+    if present and all(is_int32_text(v) for v in present):
+        return 'int_text'
+    return 'str'
+
+
+def _pad4(buffer):
+    buffer.extend(b'\0' * (-len(buffer) % 4))
+
+
+def encode_compact_roster(operators):
+    """
+    把干员列表编码为紧凑格式的字节串
+    """
+    strings = []
+    string_ids = {}
+
+    def intern(text):
+        index = string_ids.get(text)
+        if index is None:
+            index = string_ids[text] = len(strings)
+            strings.append(text)
+        return index
+
+    data = bytearray()
+    columns = []
+
+    def add_section(values):
+        offset = len(data)
+        data.extend(values.tobytes())
+        _pad4(data)
+        return offset
+
+    for name in column_order(operators):
+        values = [op.get(name, _MISSING) for op in operators]
+        kind = column_kind(name, values)
+        column = {'name': name, 'kind': kind}
+
+        if kind in ('int_text', 'int'):
+            column['offset'] = add_section(array('i', [MISSING_INT if v is _MISSING else int(v) for v in values]))
+        elif kind == 'float':
+            # float64占8字节，先补齐到8字节边界
+            data.extend(b'\0' * (-len(data) % 8))
+            column['offset'] = add_section(array('d', [MISSING_FLOAT if v is _MISSING else v for v in values]))
+        elif kind == 'str':
+            column['offset'] = add_section(array('I', [MISSING_INDEX if v is _MISSING else intern(v) for v in values]))
+        else:
+            # 第i个干员的列表为 items[starts[i]:starts[i+1]]，缺失时 present[i] 为0
+            starts = array('I', [0])
+            items = array('I')
+            for value in values:
+                if value is not _MISSING:
+                    items.extend(intern(item) for item in value)
+                starts.append(len(items))
+            column['offset'] = add_section(starts)
+            column['items_offset'] = add_section(items)
+            column['present_offset'] = add_section(
+                array('B', [0 if v is _MISSING else 1 for v in values])
+            )
+        columns.append(column)
+
+    encoded = [text.encode('utf-8') for text in strings]
+    string_offsets = array('I', [0])
+    for blob in encoded:
+        string_offsets.append(string_offsets[-1] + len(blob))
+    strings_info = {
+        'count': len(strings),
+        'offsets': add_section(string_offsets),
+        'data': len(data),
+    }
+    data.extend(b''.join(encoded))
+
+    header = json.dumps({
+        'rows': len(operators),
+        'byteorder': sys.byteorder,
+        'strings': strings_info,
+        'columns': columns,
+    }, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    header += b' ' * (-(HEADER_STRUCT.size + len(header)) % 4)
+
+    return HEADER_STRUCT.pack(COMPACT_MAGIC, COMPACT_VERSION, len(header)) + header + bytes(data)
+
+
+def write_compact_roster(operators, output_file=COMPACT_FILE):
+    """
+    原子地写入紧凑格式的名册文件
+    """
+    temp_file = f"{output_file}.tmp"
+    with open(temp_file, 'wb') as file:
+        file.write(encode_compact_roster(operators))
+    os.replace(temp_file, output_file)
+
+
+class OperatorRecord:
+    """
+    紧凑名册中的一条干员记录，按字典的方式只读访问，访问时才解码字段
+    所属的 CompactRoster 关闭后不可再使用
+    """
+    __slots__ = ('_roster', '_row')
+
+    def __init__(self, roster, row):
+        self._roster = roster
+        self._row = row
+
+    def __getitem__(self, key):
+        value = self._roster.value(self._row, key)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def get(self, key, default=None):
+        value = self._roster.value(self._row, key)
+        return default if value is _MISSING else value
+
+    def __contains__(self, key):
+        return self._roster.value(self._row, key) is not _MISSING
+
+    def keys(self):
+        return [name for name in self._roster.fields if name in self]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def to_dict(self):
+        """
+        解码全部字段，得到与JSON名册中相同的字典
+        """
+        result = {}
+        for name in self._roster.fields:
+            value = self._roster.value(self._row, name)
+            if value is not _MISSING:
+                result[name] = value
+        return result
+
+    def __repr__(self):
+        return f"OperatorRecord({self._row}, {self.get('姓名')!r})"
+
+
+class CompactRoster:
+    """
+    通过mmap读取的紧凑名册，按下标得到 OperatorRecord
+    字符串只在第一次被访问时解码，之后缓存
+    """
+    def __init__(self, path):
+        with open(path, 'rb') as file:
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._views = []
+        try:
+            self._load()
+        except Exception:
+            self.close()
+            raise
+
+    def _view(self, start, length, fmt='B'):
+        view = self._buffer[start:start + length].cast(fmt)
+        self._views.append(view)
+        return view
+
+    def _load(self):
+        self._buffer = memoryview(self._mmap)
+        self._views.append(self._buffer)
+        magic, version, header_len = HEADER_STRUCT.unpack_from(self._buffer, 0)
+        if magic != COMPACT_MAGIC or version != COMPACT_VERSION:
+            raise ValueError("不是受支持的紧凑名册文件")
+        header = json.loads(bytes(self._buffer[HEADER_STRUCT.size:HEADER_STRUCT.size + header_len]))
+        if header['byteorder'] != sys.byteorder:
+            raise ValueError("紧凑名册文件的字节序与当前平台不一致，请重新转换")
+
+        base = HEADER_STRUCT.size + header_len
+        rows = self.rows = header['rows']
+        strings = header['strings']
+        self._string_offsets = self._view(base + strings['offsets'], 4 * (strings['count'] + 1), 'I')
+        self._string_data = self._view(base + strings['data'], self._string_offsets[-1])
+        self._strings = [None] * strings['count']
+
+        self.fields = tuple(column['name'] for column in header['columns'])
+        self._columns = {}
+        for column in header['columns']:
+            kind = column['kind']
+            if kind in ('int_text', 'int'):
+                self._columns[column['name']] = (kind, self._view(base + column['offset'], 4 * rows, 'i'))
+            elif kind == 'float':
+                self._columns[column['name']] = (kind, self._view(base + column['offset'], 8 * rows, 'd'))
+            elif kind == 'str':
+                self._columns[column['name']] = (kind, self._view(base + column['offset'], 4 * rows, 'I'))
+            else:
+                starts = self._view(base + column['offset'], 4 * (rows + 1), 'I')
+                items = self._view(base + column['items_offset'], 4 * starts[rows], 'I')
+                present = self._view(base + column['present_offset'], rows)
+                self._columns[column['name']] = (kind, (starts, items, present))
+
+    def string(self, index):
+        text = self._strings[index]
+        if text is None:
+            start, end = self._string_offsets[index], self._string_offsets[index + 1]
+            text = self._strings[index] = str(self._string_data[start:end], 'utf-8')
+        return text
+
+    def value(self, row, name):
+        """
+        读取一个字段，字段缺失时返回 _MISSING
+        """
+        column = self._columns.get(name)
+        if column is None:
+            return _MISSING
+        kind, data = column
+        if kind == 'str':
+            index = data[row]
+            return _MISSING if index == MISSING_INDEX else self.string(index)
+        if kind == 'int_text':
+            number = data[row]
+            return _MISSING if number == MISSING_INT else str(number)
+        if kind == 'int':
+            number = data[row]
+            return _MISSING if number == MISSING_INT else number
+        if kind == 'float':
+            number = data[row]
+            return _MISSING if number != number else number
+        starts, items, present = data
+        if not present[row]:
+            return _MISSING
+        return [self.string(items[i]) for i in range(starts[row], starts[row + 1])]
+
+    def __len__(self):
+        return self.rows
+
+    def __getitem__(self, row):
+        if not -self.rows <= row < self.rows:
+            raise IndexError(row)
+        return OperatorRecord(self, row % self.rows)
+
+    def __iter__(self):
+        return (OperatorRecord(self, row) for row in range(self.rows))
+
+    def close(self):
+        # 先释放所有指向mmap的视图，否则无法关闭映射（Windows下也无法替换文件）
+        for view in reversed(self._views):
+            view.release()
+        self._views = []
+        self._mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def load_roster(path):
+    """
+    读取干员名册，返回字典列表；以 .bin 结尾的路径按紧凑格式读取，否则按JSON读取
+    """
+    if path.endswith(COMPACT_SUFFIX):
+        with CompactRoster(path) as roster:
+            return [record.to_dict() for record in roster]
+    with open(path, 'r', encoding='utf-8') as file:
+        return json.load(file)
+
+
+@contextmanager
+def open_roster(path):
+    """
+    打开干员名册，用于只访问少数字段（如姓名、头像URL）的场景
+    .bin 名册直接返回 CompactRoster，记录的字段在访问时才解码，离开with块后记录不可再访问；
+    其他路径返回 json.load 读出的字典列表
+    """
+    if path.endswith(COMPACT_SUFFIX):
+        with CompactRoster(path) as roster:
+            yield roster
+    else:
+        with open(path, 'r', encoding='utf-8') as file:
+            yield json.load(file)
+
+
+def convert_roster(json_file='operators_data.json', output_file=COMPACT_FILE):
+    """
+    把JSON名册转换为紧凑格式，并确认读回的数据与原数据完全一致
+    """
+    with open(json_file, 'r', encoding='utf-8') as file:
+        operators = json.load(file)
+    write_compact_roster(operators, output_file)
+    if load_roster(output_file) != operators:
+        os.remove(output_file)
+        raise ValueError("紧凑名册读回的数据与原JSON不一致")
+    print(f"✅ 已转换 {len(operators)} 个干员: {json_file} ({os.path.getsize(json_file) / 1024:.1f} KB)"
+          f" -> {output_file} ({os.path.getsize(output_file) / 1024:.1f} KB)")
+    return output_file
+
+
+def benchmark_roster(json_file='operators_data.json', compact_file=COMPACT_FILE, repeat=20):
+    """
+    对比 json.load 与紧凑格式的加载耗时和内存占用（tracemalloc统计的分配峰值）
+    """
+    def measure(func):
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        tracemalloc.start()
+        result = func()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        del result
+        return best, peak
+
+    def load_json():
+        with open(json_file, 'r', encoding='utf-8') as file:
+            return json.load(file)
+
+    def load_names():
+        # 只访问姓名字段（头像校验和精灵图的用法），其余字段不会被解码
+        with open_roster(compact_file) as roster:
+            return [record['姓名'] for record in roster]
+
+    def load_json_names():
+        with open_roster(json_file) as roster:
+            return [record['姓名'] for record in roster]
+
+    results = [
+        ('json.load', measure(load_json)),
+        ('紧凑格式(全部字段)', measure(lambda: load_roster(compact_file))),
+        ('json.load(仅姓名)', measure(load_json_names)),
+        ('紧凑格式(仅姓名)', measure(load_names)),
+    ]
+    print(f"文件大小: JSON {os.path.getsize(json_file) / 1024:.1f} KB, "
+          f"紧凑格式 {os.path.getsize(compact_file) / 1024:.1f} KB")
+    for label, (elapsed, peak) in results:
+        print(f"{label}: {elapsed * 1000:.2f} ms, 内存峰值 {peak / 1024:.1f} KB")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="把干员名册转换为紧凑的二进制格式")
+    parser.add_argument('json_file', nargs='?', default='operators_data.json')
+    parser.add_argument('-o', '--output', default=COMPACT_FILE, help="紧凑名册的输出路径")
+    parser.add_argument('--benchmark', action='store_true', help="转换后对比JSON与紧凑格式的加载耗时和内存")
+    args = parser.parse_args()
+
+    convert_roster(args.json_file, args.output)
+    if args.benchmark:
+        benchmark_roster(args.json_file, args.output)
@@ -0,0 +1,568 @@
+"""
+对局状态的存储后端
+按种子生成的对局和对局房间保存在后端中：默认保存在当前进程的内存里；
+设置环境变量 STATE_BACKEND_URL=redis://主机:端口/库 后保存在Redis中，
+房间事件通过Redis的发布/订阅转发给每个worker，uvicorn --workers N 时不需要会话粘滞
+"""
+
+import abc
+import argparse
+import asyncio
+import json
+import os
+import secrets
+import threading
+import time
+import tracemalloc
+from collections import OrderedDict
+
+from rooms import (
+    MAX_CONNECTIONS, MAX_ROOMS, PLAYERS, QUEUE_SIZE, ROOM_TTL, SEAT_TTL, UNJOINED_ROOM_TTL, Room, RoomError, event_message
+)
+
+STATE_BACKEND_ENV = 'STATE_BACKEND_URL'
+
+# 按种子生成的对局在共享后端中的保存时间（秒）
+BOARD_TTL = 86400
+
+
+class BoardCache:
+    """
+    对局响应缓存
+    以(时间种子, 名册版本)为键保存序列化后的响应体，按LRU淘汰并清理已过去的分钟
+    """
+    def __init__(self, max_entries=8):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        查找缓存，命中时返回(响应体, ETag)
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, entry, current_seed=None):
+        """
+        写入缓存，并淘汰早于当前时间种子的条目
+        """
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            if current_seed is not None:
+                for old_key in [k for k in self._entries if k[0] < current_seed]:
+                    del self._entries[old_key]
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __contains__(self, key):
+        # 不计入命中率，供预生成时检查
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class LocalFanout:
+    """
+    当前进程中订阅了房间事件的连接，每个连接一个有上限的队列
+    """
+    def __init__(self):
+        self._subscribers = {}
+
+    def subscribe(self, room_id):
+        queues = self._subscribers.setdefault(room_id, set())
+        if len(queues) >= MAX_CONNECTIONS:
+            raise RoomError("房间连接数已满")
+        queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        queues.add(queue)
+        return queue
+
+    def unsubscribe(self, room_id, queue):
+        queues = self._subscribers.get(room_id)
+        if queues is not None:
+            queues.discard(queue)
+            if not queues:
+                del self._subscribers[room_id]
+
+    def count(self, room_id):
+        return len(self._subscribers.get(room_id, ()))
+
+    def rooms(self):
+        return list(self._subscribers)
+
+    def publish(self, room_id, event):
+        """
+        把事件放入房间每个连接的队列，不等待发送
+        积压已满的连接清空队列后放入None，发送方收到None时改发完整状态，保证每个连接占用的内存有上限
+        """
+        for queue in self._subscribers.get(room_id, ()):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(None)
+
+
+class StateBackend(abc.ABC):
+    """
+    对局和房间的存储接口
+    事件通过 subscribe 返回的本进程队列送达，跨进程的转发由具体后端负责
+    """
+    name = ''
+
+    def __init__(self):
+        self.fanout = LocalFanout()
+
+    async def start(self):
+        """
+        在服务启动时调用（例如开始接收其他worker发布的事件）
+        """
+
+    async def close(self):
+        """
+        在服务关闭时调用
+        """
+
+    @abc.abstractmethod
+    async def get_board(self, key):
+        """
+        查找按种子生成的对局，命中时返回(响应体, ETag)
+        """
+
+    @abc.abstractmethod
+    async def put_board(self, key, entry):
+        """
+        保存按种子生成的对局
+        """
+
+    @abc.abstractmethod
+    async def create_room(self, seed, operator_ids, roster_version):
+        """
+        创建房间并返回 Room
+        """
+
+    @abc.abstractmethod
+    async def get_room(self, room_id):
+        """
+        读取房间的当前状态，不存在或已过期时返回None
+        """
+
+    @abc.abstractmethod
+    async def join(self, room_id, player):
+        """
+        原子地加入player的座位，返回座位的令牌
+        """
+
+    @abc.abstractmethod
+    async def claim_seat(self, room_id, player):
+        """
+        为一个连接占用座位，座位已被其他连接（包括其他worker上的）占用时返回False
+        """
+
+    @abc.abstractmethod
+    async def release_seat(self, room_id, player):
+        """
+        连接断开时释放座位
+        """
+
+    @abc.abstractmethod
+    async def apply(self, room_id, player, event_type, operator_id):
+        """
+        原子地应用一个玩家事件，并广播给所有worker上该房间的连接，返回事件元组
+        """
+
+    @abc.abstractmethod
+    async def evict_expired(self):
+        """
+        清理或续期房间，返回清理的数量
+        """
+
+    @abc.abstractmethod
+    async def room_count(self):
+        """
+        当前的房间数
+        """
+
+    def subscribe(self, room_id):
+        return self.fanout.subscribe(room_id)
+
+    def unsubscribe(self, room_id, queue):
+        self.fanout.unsubscribe(room_id, queue)
+
+
+class MemoryBackend(StateBackend):
+    """
+    进程内的存储，只适用于单个worker
+    超过ttl秒（还没有玩家加入的为unjoined_ttl秒）没有活动且没有连接的房间被清理，房间数达到上限时拒绝创建新房间
+    """
+    name = 'memory'
+
+    def __init__(self, ttl=ROOM_TTL, max_rooms=MAX_ROOMS, board_entries=256, unjoined_ttl=UNJOINED_ROOM_TTL):
+        super().__init__()
+        self.ttl = ttl
+        self.unjoined_ttl = unjoined_ttl
+        self.max_rooms = max_rooms
+        self.evicted = 0
+        self.boards = BoardCache(max_entries=board_entries)
+        self._rooms = {}
+        self._seats = set()
+
+    async def get_board(self, key):
+        return self.boards.get(key)
+
+    async def put_board(self, key, entry):
+        self.boards.put(key, entry)
+
+    async def create_room(self, seed, operator_ids, roster_version):
+        now = time.monotonic()
+        if len(self._rooms) >= self.max_rooms:
+            self._evict_expired(now)
+        if len(self._rooms) >= self.max_rooms:
+            raise RoomError("房间数量已达上限")
+        room_id = secrets.token_urlsafe(6)
+        while room_id in self._rooms:
+            room_id = secrets.token_urlsafe(6)
+        room = self._rooms[room_id] = Room(room_id, seed, operator_ids, roster_version, now)
+        return room
+
+    def _get(self, room_id, now):
+        room = self._rooms.get(room_id)
+        if room is not None and self._expired(room, now):
+            del self._rooms[room_id]
+            self.evicted += 1
+            return None
+        return room
+
+    async def get_room(self, room_id):
+        return self._get(room_id, time.monotonic())
+
+    async def join(self, room_id, player):
+        now = time.monotonic()
+        room = self._get(room_id, now)
+        if room is None:
+            raise RoomError("房间不存在或已过期")
+        return room.join(player, now)
+
+    async def claim_seat(self, room_id, player):
+        if (room_id, player) in self._seats:
+            return False
+        self._seats.add((room_id, player))
+        return True
+
+    async def release_seat(self, room_id, player):
+        self._seats.discard((room_id, player))
+
+    async def apply(self, room_id, player, event_type, operator_id):
+        now = time.monotonic()
+        room = self._get(room_id, now)
+        if room is None:
+            raise RoomError("房间不存在或已过期")
+        event = room.apply(player, event_type, operator_id, now)
+        self.fanout.publish(room_id, event)
+        return event
+
+    def subscribe(self, room_id):
+        queue = super().subscribe(room_id)
+        room = self._rooms.get(room_id)
+        if room is not None:
+            room.touched_at = time.monotonic()
+        return queue
+
+    def unsubscribe(self, room_id, queue):
+        super().unsubscribe(room_id, queue)
+        room = self._rooms.get(room_id)
+        if room is not None:
+            room.touched_at = time.monotonic()
+
+    def _expired(self, room, now):
+        ttl = self.ttl if room.joined else self.unjoined_ttl
+        return not self.fanout.count(room.room_id) and now - room.touched_at > ttl
+
+    def _evict_expired(self, now):
+        expired = [room_id for room_id, room in self._rooms.items() if self._expired(room, now)]
+        for room_id in expired:
+            del self._rooms[room_id]
+        self.evicted += len(expired)
+        return len(expired)
+
+    async def evict_expired(self):
+        return self._evict_expired(time.monotonic())
+
+    async def room_count(self):
+        return len(self._rooms)
+
+
+def _text(value):
+    return value.decode('utf-8') if isinstance(value, bytes) else value
+
+
+class RedisBackend(StateBackend):
+    """
+    Redis存储，供多个worker共享
+    client 为 redis.asyncio.Redis 兼容的客户端，测试时可传入 fakeredis.aioredis.FakeRedis()
+    房间以JSON保存并设置过期时间（还没有玩家加入的为unjoined_ttl，有连接的房间由 evict_expired 续期），
+    事件在同一个事务中写入房间状态并发布到房间的频道，每个worker用一个模式订阅接收所有房间的事件；
+    座位的占用保存为带过期时间的键，值为占用它的worker，由该worker的 evict_expired 续期
+    """
+    name = 'redis'
+
+    def __init__(self, client, prefix='guesswho', ttl=ROOM_TTL, board_ttl=BOARD_TTL,
+                 unjoined_ttl=UNJOINED_ROOM_TTL, seat_ttl=SEAT_TTL):
+        super().__init__()
+        self.client = client
+        self.prefix = prefix
+        self.ttl = ttl
+        self.unjoined_ttl = unjoined_ttl
+        self.board_ttl = board_ttl
+        self.seat_ttl = seat_ttl
+        self.worker_id = secrets.token_hex(8)
+        self._seats = set()
+        self._pubsub = None
+        self._listener = None
+
+    def _room_key(self, room_id):
+        return f"{self.prefix}:room:{room_id}"
+
+    def _seat_key(self, room_id, player):
+        return f"{self.prefix}:seat:{room_id}:{player}"
+
+    def _board_key(self, key):
+        return f"{self.prefix}:board:{key}"
+
+    def _channel(self, room_id):
+        return f"{self.prefix}:events:{room_id}"
+
+    async def start(self):
+        self._pubsub = self.client.pubsub()
+        await self._pubsub.psubscribe(self._channel('*'))
+        self._listener = asyncio.ensure_future(self._listen())
+
+    async def _listen(self):
+        channel_prefix = self._channel('')
+        async for message in self._pubsub.listen():
+            if message['type'] != 'pmessage':
+                continue
+            room_id = _text(message['channel'])[len(channel_prefix):]
+            self.fanout.publish(room_id, tuple(json.loads(message['data'])))
+
+    async def close(self):
+        if self._listener is not None:
+            self._listener.cancel()
+            self._listener = None
+        if self._pubsub is not None:
+            await self._pubsub.aclose()
+            self._pubsub = None
+        await self.client.aclose()
+
+    async def get_board(self, key):
+        body, etag = await self.client.hmget(self._board_key(key), 'body', 'etag')
+        if body is None or etag is None:
+            return None
+        return body, _text(etag)
+
+    async def put_board(self, key, entry):
+        body, etag = entry
+        board_key = self._board_key(key)
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.hset(board_key, mapping={'body': body, 'etag': etag})
+            pipe.expire(board_key, self.board_ttl)
+            await pipe.execute()
+
+    async def create_room(self, seed, operator_ids, roster_version):
+        while True:
+            room = Room(secrets.token_urlsafe(6), seed, operator_ids, roster_version, time.monotonic())
+            state = json.dumps(room.to_state(), ensure_ascii=False)
+            # NX: 房间id重复时重新生成
+            if await self.client.set(self._room_key(room.room_id), state, nx=True, ex=self.unjoined_ttl):
+                return room
+
+    async def get_room(self, room_id):
+        state = await self.client.get(self._room_key(room_id))
+        if state is None:
+            return None
+        return Room.from_state(json.loads(state))
+
+    async def _update(self, room_id, update):
+        """
+        在事务中读取房间、调用update(room)修改并写回，update返回(结果, 要广播的事件或None)
+        """
+        from redis.exceptions import WatchError
+
+        key = self._room_key(room_id)
+        async with self.client.pipeline(transaction=True) as pipe:
+            while True:
+                try:
+                    # 乐观锁：其他worker在读取后修改了房间时重试
+                    await pipe.watch(key)
+                    state = await pipe.get(key)
+                    if state is None:
+                        raise RoomError("房间不存在或已过期")
+                    room = Room.from_state(json.loads(state))
+                    result, event = update(room)
+                    pipe.multi()
+                    pipe.set(key, json.dumps(room.to_state(), ensure_ascii=False), ex=self.ttl)
+                    if event is not None:
+                        pipe.publish(self._channel(room_id), json.dumps(event, ensure_ascii=False))
+                    await pipe.execute()
+                    return result
+                except WatchError:
+                    continue
+
+    async def join(self, room_id, player):
+        return await self._update(room_id, lambda room: (room.join(player), None))
+
+    async def claim_seat(self, room_id, player):
+        if not await self.client.set(self._seat_key(room_id, player), self.worker_id, nx=True, ex=self.seat_ttl):
+            return False
+        self._seats.add((room_id, player))
+        return True
+
+    async def release_seat(self, room_id, player):
+        from redis.exceptions import WatchError
+
+        self._seats.discard((room_id, player))
+        key = self._seat_key(room_id, player)
+        async with self.client.pipeline(transaction=True) as pipe:
+            try:
+                # 只删除本worker占用的座位，续期失败后座位可能已被其他worker占用
+                await pipe.watch(key)
+                if _text(await pipe.get(key)) != self.worker_id:
+                    return
+                pipe.multi()
+                pipe.delete(key)
+                await pipe.execute()
+            except WatchError:
+                pass
+
+    async def apply(self, room_id, player, event_type, operator_id):
+        def update(room):
+            event = room.apply(player, event_type, operator_id)
+            return event, event
+
+        return await self._update(room_id, update)
+
+    async def evict_expired(self):
+        # 过期由Redis负责，这里只为本worker上仍有连接的房间和占用的座位续期
+        for room_id in self.fanout.rooms():
+            await self.client.expire(self._room_key(room_id), self.ttl)
+        for room_id, player in list(self._seats):
+            await self.client.expire(self._seat_key(room_id, player), self.seat_ttl)
+        return 0
+
+    async def room_count(self):
+        count = 0
+        async for _ in self.client.scan_iter(match=self._room_key('*'), count=1000):
+            count += 1
+        return count
+
+
+def create_backend(url=None):
+    """
+    根据URL（默认读取环境变量 STATE_BACKEND_URL）创建存储后端
+    未设置或为 memory 时使用进程内存储，redis:// 或 rediss:// 时使用Redis（需要安装redis）
+    """
+    url = url or os.environ.get(STATE_BACKEND_ENV) or 'memory'
+    if url == 'memory':
+        return MemoryBackend()
+    if url.startswith(('redis://', 'rediss://')):
+        try:
+            import redis.asyncio
+        except ImportError:
+            raise RuntimeError("使用Redis存储需要先安装redis: uv pip install redis")
+        return RedisBackend(redis.asyncio.from_url(url))
+    raise ValueError(f"不支持的存储后端: {url}")
+
+
+async def _run_rooms(backend, room_count, events_per_room, connections):
+    """
+    创建房间和连接，逐轮向每个房间应用事件并由各连接的消费任务取走，返回(房间id列表, 送达次数)
+    """
+    operator_ids = list(range(30))
+    delivered = 0
+
+    async def drain(queue):
+        nonlocal delivered
+        while True:
+            event = await queue.get()
+            if event is StopAsyncIteration:
+                return
+            if event is not None:
+                event_message(event)
+            delivered += 1
+
+    room_ids = [(await backend.create_room(f"bench-{i}", operator_ids, 'bench')).room_id
+                for i in range(room_count)]
+    queues = [(room_id, backend.subscribe(room_id)) for room_id in room_ids for _ in range(connections)]
+    tasks = [asyncio.ensure_future(drain(queue)) for _, queue in queues]
+
+    for step in range(events_per_room):
+        player = PLAYERS[step % 2]
+        operator_id = (step // 2) % 30
+        event_type = 'exclude' if (step // 60) % 2 == 0 else 'include'
+        for room_id in room_ids:
+            await backend.apply(room_id, player, event_type, operator_id)
+        # 让消费任务取走队列中的事件，相当于每一轮事件之间的网络发送
+        await asyncio.sleep(0)
+
+    # 等待跨进程转发的事件送达后再结束消费任务
+    await asyncio.sleep(0.1)
+    for room_id, queue in queues:
+        backend.unsubscribe(room_id, queue)
+        queue.put_nowait(StopAsyncIteration)
+    await asyncio.gather(*tasks)
+    return room_ids, delivered
+
+
+async def benchmark_rooms(url=None, room_count=5000, events_per_room=200, spectators=1, memory_rooms=500):
+    """
+    负载测试：在一个进程中创建大量房间，每个房间有双方玩家和观战者的连接，
+    模拟一局中的排除/选定事件，统计吞吐量；再用tracemalloc测量每个房间在本进程中常驻的内存
+    （tracemalloc会显著拖慢分配，因此只在memory_rooms个房间上测量）
+    """
+    connections = 2 + spectators
+
+    backend = create_backend(url)
+    await backend.start()
+    start = time.perf_counter()
+    room_ids, delivered = await _run_rooms(backend, room_count, events_per_room, connections)
+    elapsed = time.perf_counter() - start
+    await backend.close()
+
+    backend = create_backend(url)
+    await backend.start()
+    tracemalloc.start()
+    room_ids, _ = await _run_rooms(backend, memory_rooms, events_per_room, connections)
+    current = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    await backend.close()
+    per_room = current / memory_rooms
+
+    total_events = room_count * events_per_room
+    print(f"存储后端: {backend.name}")
+    print(f"房间数: {room_count}, 每个房间 {connections} 个连接, 每个房间 {events_per_room} 个事件")
+    print(f"事件: {total_events} 个, 送达 {delivered} 次, 耗时 {elapsed:.2f} s ({total_events / elapsed:.0f} 事件/s)")
+    print(f"内存: 每个房间约 {per_room / 1024:.1f} KB，{room_count} 个房间约 {per_room * room_count / 1024 / 1024:.1f} MB")
+    return elapsed, per_room
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="对局房间负载测试")
+    parser.add_argument('--url', default=None, help="存储后端，默认读取环境变量 STATE_BACKEND_URL，未设置时为 memory")
+    parser.add_argument('--rooms', type=int, default=5000, help="同时存在的房间数")
+    parser.add_argument('--events', type=int, default=200, help="每个房间的事件数")
+    parser.add_argument('--spectators', type=int, default=1, help="每个房间的观战连接数")
+    args = parser.parse_args()
+
+    asyncio.run(benchmark_rooms(args.url, args.rooms, args.events, args.spectators))
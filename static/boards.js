@@ -0,0 +1,286 @@
+/*
+ * 对局的生成规则（boards.py 的 JavaScript 实现），供静态站在浏览器中直接生成对局
+ * 与Python逐位一致：
+ *   selectBoardIndices 等价于 random.Random(seed).sample(range(rosterSize), count)（MT19937）
+ *   generateVerificationCode 等价于 boards.generate_verification_code（8字节BLAKE2b）
+ * 用 static_site.py 导出的 test_vectors.json 校验: node static/boards.js site/test_vectors.json
+ */
+(function (root) {
+    'use strict';
+
+    const N = 624;
+    const M = 397;
+
+    class MersenneTwister {
+        constructor(key) {
+            this.mt = new Uint32Array(N);
+            this.mti = N + 1;
+            this.initByArray(key);
+        }
+
+        initGenrand(s) {
+            const mt = this.mt;
+            mt[0] = s >>> 0;
+            for (let i = 1; i < N; i++) {
+                const prev = mt[i - 1] ^ (mt[i - 1] >>> 30);
+                mt[i] = (Math.imul(1812433253, prev) + i) >>> 0;
+            }
+            this.mti = N;
+        }
+
+        initByArray(key) {
+            const mt = this.mt;
+            this.initGenrand(19650218);
+            let i = 1;
+            let j = 0;
+            for (let k = Math.max(N, key.length); k > 0; k--) {
+                const prev = mt[i - 1] ^ (mt[i - 1] >>> 30);
+                mt[i] = ((mt[i] ^ Math.imul(prev, 1664525)) + key[j] + j) >>> 0;
+                i++;
+                j++;
+                if (i >= N) { mt[0] = mt[N - 1]; i = 1; }
+                if (j >= key.length) j = 0;
+            }
+            for (let k = N - 1; k > 0; k--) {
+                const prev = mt[i - 1] ^ (mt[i - 1] >>> 30);
+                mt[i] = ((mt[i] ^ Math.imul(prev, 1566083941)) - i) >>> 0;
+                i++;
+                if (i >= N) { mt[0] = mt[N - 1]; i = 1; }
+            }
+            mt[0] = 0x80000000;
+        }
+
+        nextUint32() {
+            const mt = this.mt;
+            if (this.mti >= N) {
+                for (let kk = 0; kk < N; kk++) {
+                    const y = (mt[kk] & 0x80000000) | (mt[(kk + 1) % N] & 0x7fffffff);
+                    mt[kk] = mt[(kk + M) % N] ^ (y >>> 1) ^ (y & 1 ? 0x9908b0df : 0);
+                }
+                this.mti = 0;
+            }
+            let y = mt[this.mti++];
+            y ^= y >>> 11;
+            y ^= (y << 7) & 0x9d2c5680;
+            y ^= (y << 15) & 0xefc60000;
+            y ^= y >>> 18;
+            return y >>> 0;
+        }
+
+        getrandbits(k) {
+            // 对局只需要 k <= 32
+            return k === 0 ? 0 : this.nextUint32() >>> (32 - k);
+        }
+
+        randbelow(n) {
+            const k = 32 - Math.clz32(n);
+            let r = this.getrandbits(k);
+            while (r >= n) r = this.getrandbits(k);
+            return r;
+        }
+    }
+
+    const encoder = new TextEncoder();
+
+    async function seedKey(seed) {
+        // random.seed(str) 的第2版规则：种子为 UTF-8(seed) + SHA512(UTF-8(seed)) 的大端整数，
+        // 再按32位从低到高拆成 init_by_array 的参数
+        const data = encoder.encode(seed);
+        const digest = new Uint8Array(await root.crypto.subtle.digest('SHA-512', data));
+        const bytes = new Uint8Array(data.length + digest.length);
+        bytes.set(data);
+        bytes.set(digest, data.length);
+
+        let start = 0;
+        while (start < bytes.length && bytes[start] === 0) start++;
+        const key = [];
+        for (let end = bytes.length; end > start; end -= 4) {
+            let word = 0;
+            for (let i = Math.max(start, end - 4); i < end; i++) word = (word * 256) + bytes[i];
+            key.push(word >>> 0);
+        }
+        return key.length ? key : [0];
+    }
+
+    function sample(rng, n, k) {
+        if (!(k >= 0 && k <= n)) throw new RangeError('Sample larger than population or is negative');
+        const result = new Array(k);
+        let setsize = 21;
+        if (k > 5) setsize += 4 ** Math.ceil(Math.log(k * 3) / Math.log(4));
+        if (n <= setsize) {
+            const pool = Array.from({ length: n }, (_, i) => i);
+            for (let i = 0; i < k; i++) {
+                const j = rng.randbelow(n - i);
+                result[i] = pool[j];
+                pool[j] = pool[n - i - 1];
+            }
+        } else {
+            const selected = new Set();
+            for (let i = 0; i < k; i++) {
+                let j = rng.randbelow(n);
+                while (selected.has(j)) j = rng.randbelow(n);
+                selected.add(j);
+                result[i] = j;
+            }
+        }
+        return result;
+    }
+
+    async function selectBoardIndices(rosterSize, seed, count) {
+        const rng = new MersenneTwister(await seedKey(String(seed)));
+        return sample(rng, rosterSize, count);
+    }
+
+    async function selectFilteredIndices(rosterSize, seed, candidates, count) {
+        if (!candidates) return selectBoardIndices(rosterSize, seed, count);
+        return (await selectBoardIndices(candidates.length, seed, count)).map(i => candidates[i]);
+    }
+
+    // BLAKE2b，只实现不带密钥的摘要
+    const MASK64 = (1n << 64n) - 1n;
+    const BLAKE2B_IV = [
+        0x6a09e667f3bcc908n, 0xbb67ae8584caa73bn, 0x3c6ef372fe94f82bn, 0xa54ff53a5f1d36f1n,
+        0x510e527fade682d1n, 0x9b05688c2b3e6c1fn, 0x1f83d9abfb41bd6bn, 0x5be0cd19137e2179n,
+    ];
+    const SIGMA = [
+        [0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14, 15],
+        [14, 10, 4, 8, 9, 15, 13, 6, 1, 12, 0, 2, 11, 7, 5, 3],
+        [11, 8, 12, 0, 5, 2, 15, 13, 10, 14, 3, 6, 7, 1, 9, 4],
+        [7, 9, 3, 1, 13, 12, 11, 14, 2, 6, 5, 10, 4, 0, 15, 8],
+        [9, 0, 5, 7, 2, 4, 10, 15, 14, 1, 11, 12, 6, 8, 3, 13],
+        [2, 12, 6, 10, 0, 11, 8, 3, 4, 13, 7, 5, 15, 14, 1, 9],
+        [12, 5, 1, 15, 14, 13, 4, 10, 0, 7, 6, 3, 9, 2, 8, 11],
+        [13, 11, 7, 14, 12, 1, 3, 9, 5, 0, 15, 4, 8, 6, 2, 10],
+        [6, 15, 14, 9, 11, 3, 0, 8, 12, 2, 13, 7, 1, 4, 10, 5],
+        [10, 2, 8, 4, 7, 6, 1, 5, 15, 11, 9, 14, 3, 12, 13, 0],
+    ];
+
+    function rotr64(x, n) {
+        return ((x >> n) | (x << (64n - n))) & MASK64;
+    }
+
+    function blake2bCompress(h, block, offset, t, last) {
+        const m = new Array(16);
+        for (let i = 0; i < 16; i++) {
+            let word = 0n;
+            for (let b = 7; b >= 0; b--) word = (word << 8n) | BigInt(block[offset + i * 8 + b] || 0);
+            m[i] = word;
+        }
+        const v = h.concat(BLAKE2B_IV);
+        v[12] ^= BigInt(t) & MASK64;
+        if (last) v[14] ^= MASK64;
+
+        const g = (a, b, c, d, x, y) => {
+            v[a] = (v[a] + v[b] + x) & MASK64;
+            v[d] = rotr64(v[d] ^ v[a], 32n);
+            v[c] = (v[c] + v[d]) & MASK64;
+            v[b] = rotr64(v[b] ^ v[c], 24n);
+            v[a] = (v[a] + v[b] + y) & MASK64;
+            v[d] = rotr64(v[d] ^ v[a], 16n);
+            v[c] = (v[c] + v[d]) & MASK64;
+            v[b] = rotr64(v[b] ^ v[c], 63n);
+        };
+
+        for (let round = 0; round < 12; round++) {
+            const s = SIGMA[round % 10];
+            g(0, 4, 8, 12, m[s[0]], m[s[1]]);
+            g(1, 5, 9, 13, m[s[2]], m[s[3]]);
+            g(2, 6, 10, 14, m[s[4]], m[s[5]]);
+            g(3, 7, 11, 15, m[s[6]], m[s[7]]);
+            g(0, 5, 10, 15, m[s[8]], m[s[9]]);
+            g(1, 6, 11, 12, m[s[10]], m[s[11]]);
+            g(2, 7, 8, 13, m[s[12]], m[s[13]]);
+            g(3, 4, 9, 14, m[s[14]], m[s[15]]);
+        }
+        for (let i = 0; i < 8; i++) h[i] ^= v[i] ^ v[i + 8];
+    }
+
+    function blake2b(data, digestSize) {
+        const h = BLAKE2B_IV.slice();
+        h[0] ^= 0x01010000n ^ BigInt(digestSize);
+        let offset = 0;
+        while (data.length - offset > 128) {
+            blake2bCompress(h, data, offset, offset + 128, false);
+            offset += 128;
+        }
+        blake2bCompress(h, data, offset, data.length, true);
+
+        const digest = new Uint8Array(digestSize);
+        for (let i = 0; i < digestSize; i++) digest[i] = Number((h[i >> 3] >> BigInt((i & 7) * 8)) & 0xffn);
+        return digest;
+    }
+
+    function generateVerificationCode(operatorIds, seed, rosterVersion, length) {
+        if (!(length >= 1 && length <= 18)) throw new RangeError(`校验码位数需在1到18之间: ${length}`);
+        const prefix = encoder.encode(`${rosterVersion || ''}:${seed}:`);
+        const data = new Uint8Array(prefix.length + operatorIds.length * 2);
+        data.set(prefix);
+        operatorIds.forEach((id, i) => {
+            data[prefix.length + i * 2] = id & 0xff;
+            data[prefix.length + i * 2 + 1] = (id >>> 8) & 0xff;
+        });
+
+        const digest = blake2b(data, 8);
+        let value = 0n;
+        for (let i = 7; i >= 0; i--) value = (value << 8n) | BigInt(digest[i]);
+        return (value % (10n ** BigInt(length))).toString().padStart(length, '0');
+    }
+
+    // 与 boards.TIME_SEED_TZ 相同，时间种子按北京时间（UTC+8）计算，与玩家所在时区无关
+    const TIME_SEED_OFFSET_MS = 8 * 60 * 60 * 1000;
+
+    function getTimeSeed(now) {
+        // 与 boards.get_time_seed 相同，取 年月日时分
+        const t = new Date((now || new Date()).getTime() + TIME_SEED_OFFSET_MS);
+        const pad = n => String(n).padStart(2, '0');
+        return `${t.getUTCFullYear()}${pad(t.getUTCMonth() + 1)}${pad(t.getUTCDate())}${pad(t.getUTCHours())}${pad(t.getUTCMinutes())}`;
+    }
+
+    function formatTimeSeed(seed) {
+        // 与服务端对局响应中的timestamp相同: YYYY-MM-DD HH:MM
+        return `${seed.slice(0, 4)}-${seed.slice(4, 6)}-${seed.slice(6, 8)} ${seed.slice(8, 10)}:${seed.slice(10, 12)}`;
+    }
+
+    async function checkTestVectors(vectors) {
+        // 返回与Python结果不一致的用例
+        const failures = [];
+        for (const vector of vectors.time_seeds || []) {
+            const seed = getTimeSeed(new Date(vector.timestamp_ms));
+            if (seed !== vector.time_seed) failures.push({ vector, time_seed: seed });
+        }
+        for (const vector of vectors.cases) {
+            const ids = await selectFilteredIndices(vector.roster_size, vector.seed, vector.candidates, vector.count);
+            const code = generateVerificationCode(ids, vector.seed, vector.roster_version, vector.length);
+            if (ids.join(',') !== vector.operator_ids.join(',') || code !== vector.verification_code) {
+                failures.push({ vector, operator_ids: ids, verification_code: code });
+            }
+        }
+        return failures;
+    }
+
+    const Boards = {
+        MersenneTwister,
+        blake2b,
+        selectBoardIndices,
+        selectFilteredIndices,
+        generateVerificationCode,
+        getTimeSeed,
+        formatTimeSeed,
+        checkTestVectors,
+    };
+
+    if (typeof module !== 'undefined' && module.exports) {
+        module.exports = Boards;
+        if (typeof require !== 'undefined' && require.main === module) {
+            const vectors = JSON.parse(require('fs').readFileSync(process.argv[2], 'utf8'));
+            checkTestVectors(vectors).then(failures => {
+                failures.forEach(f => console.error('不一致:', JSON.stringify(f)));
+                const total = vectors.cases.length + (vectors.time_seeds || []).length;
+                console.log(`${total - failures.length}/${total} 个用例与Python一致`);
+                process.exit(failures.length ? 1 : 0);
+            });
+        }
+    } else {
+        root.Boards = Boards;
+    }
+})(typeof globalThis !== 'undefined' ? globalThis : window);
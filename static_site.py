@@ -0,0 +1,178 @@
+"""
+导出无需后端的静态站，可直接部署到 GitHub Pages
+站点包含前端页面、对局规则的JS实现(static/boards.js)、紧凑名册 roster.json 和用到的头像，
+浏览器按种子在本地生成对局和校验码，不再请求服务端
+test_vectors.json 是Python实现生成的对局和校验码，用于校验JS实现与服务端逐位一致
+"""
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import time
+from datetime import datetime, timedelta, timezone
+
+from boards import BOARD_SIZE, VERIFICATION_CODE_LENGTH, generate_verification_code, get_time_seed, select_filtered_indices
+from main import SLIM_FIELDS, RosterStore
+
+SITE_FOLDER = 'site'
+BOARDS_SCRIPT = os.path.join('static', 'boards.js')
+INDEX_PAGE = os.path.join('static', 'index.html')
+
+# 服务端地址前缀 -> 本地文件夹，导出时把头像复制到站点中同名的相对路径下
+AVATAR_URL_FOLDERS = {
+    '/static/avatars_opt/': os.path.join('static', 'avatars_opt'),
+    '/avatars/': 'avatars',
+}
+
+
+def build_roster_bundle(store, board_size=BOARD_SIZE, code_length=None):
+    """
+    把精简名册压缩为 字段列表 + 每个干员一行取值 的形式，头像地址改为站点内的相对路径
+    名册版本沿用服务端的版本号，同一分钟的静态站和服务端得到相同的对局和校验码
+    返回 (名册, 需要复制的头像 {相对路径: 本地文件})
+    """
+    # 字段列表取自精简视图的定义而非某个干员，缺少某字段（如没有缩略图）的干员在该列中记为null
+    fields = [field for field in SLIM_FIELDS if field != 'id']
+    avatars = {}
+    rows = []
+    for operator in store.slim_operators:
+        row = []
+        for field in fields:
+            value = operator.get(field)
+            if field in ('avatar_url', 'avatar_png_url') and value:
+                for prefix, folder in AVATAR_URL_FOLDERS.items():
+                    if value.startswith(prefix):
+                        filename = value[len(prefix):]
+                        value = f"{prefix.strip('/')}/{filename}"
+                        avatars[value] = os.path.join(folder, filename)
+                        break
+            row.append(value)
+        rows.append(row)
+
+    bundle = {
+        'roster_version': store.version,
+        'board_size': board_size,
+        'code_length': VERIFICATION_CODE_LENGTH if code_length is None else code_length,
+        'fields': fields,
+        'operators': rows,
+    }
+    return bundle, avatars
+
+
+def build_test_vectors(roster_version, roster_size, board_size=BOARD_SIZE):
+    """
+    用Python实现生成一组对局和校验码作为JS实现的校验用例
+    覆盖时间种子与任意字符串种子、random.sample 的两种抽样分支（候选数不超过/超过277）、
+    主题局的候选下标，以及1~18位的校验码；time_seeds 校验浏览器按北京时间得到的时间种子
+    """
+    now = datetime(2025, 1, 1)
+    seeds = [get_time_seed(now + timedelta(minutes=17 * i)) for i in range(24)]
+    seeds += ['', '0', 'seed', '种子', 'ドクター', '🎲', 'a' * 200, 'room:' + 'x' * 63]
+
+    cases = []
+
+    def add_case(seed, size, count, length, candidates=None, version=roster_version):
+        ids = select_filtered_indices(size, seed, candidates, count)
+        cases.append({
+            'seed': seed,
+            'roster_size': size,
+            'candidates': candidates,
+            'count': count,
+            'roster_version': version,
+            'length': length,
+            'operator_ids': ids,
+            'verification_code': generate_verification_code(ids, seed, version, length),
+        })
+
+    for i, seed in enumerate(seeds):
+        add_case(seed, roster_size, board_size, VERIFICATION_CODE_LENGTH)
+        add_case(seed, [board_size, 100, 277, 278, 1000, 65535][i % 6], board_size, i % 18 + 1, version='')
+    for size, count in ((1, 1), (5, 5), (6, 6), (21, 3), (22, 3), (2000, 300)):
+        add_case(seeds[0], size, count, 6)
+    if roster_size >= 2 * board_size:
+        add_case(seeds[1], roster_size, board_size, VERIFICATION_CODE_LENGTH, list(range(0, roster_size, 2)))
+
+    # 北京时间的跨日、跨年，以及对其他时区而言处于不同日期的时刻
+    instants = [datetime(2024, 12, 31, 15, 59, 59), datetime(2024, 12, 31, 16, 0), datetime(2025, 3, 30, 1, 30),
+                datetime(2025, 6, 30, 23, 59), datetime(2025, 10, 26, 0, 30), datetime(2026, 1, 1, 8, 0, 30)]
+    time_seeds = []
+    for instant in instants:
+        instant = instant.replace(tzinfo=timezone.utc)
+        time_seeds.append({
+            'timestamp_ms': int(instant.timestamp() * 1000),
+            'time_seed': get_time_seed(instant),
+        })
+
+    return {'roster_version': roster_version, 'time_seeds': time_seeds, 'cases': cases}
+
+
+def verify_test_vectors(vectors_path, script=BOARDS_SCRIPT):
+    """
+    用node运行JS实现校验测试用例，返回是否全部一致；没有安装node时返回None
+    """
+    node = shutil.which('node')
+    if node is None:
+        print("⚠️ 未找到node，跳过JS实现的校验")
+        return None
+    result = subprocess.run([node, script, vectors_path], capture_output=True, text=True)
+    if result.stderr:
+        print(result.stderr.strip())
+    print(result.stdout.strip())
+    return result.returncode == 0
+
+
+def export_static_site(output_folder=SITE_FOLDER, json_file='operators_data.json',
+                       avatars_folder='avatars', verify=False):
+    """
+    导出静态站到output_folder
+    """
+    start_time = time.perf_counter()
+    os.makedirs(output_folder, exist_ok=True)
+
+    store = RosterStore(json_file, avatars_folder)
+    store.reload()
+    bundle, avatars = build_roster_bundle(store)
+
+    with open(os.path.join(output_folder, 'roster.json'), 'w', encoding='utf-8') as f:
+        json.dump(bundle, f, ensure_ascii=False, separators=(',', ':'))
+
+    vectors_path = os.path.join(output_folder, 'test_vectors.json')
+    with open(vectors_path, 'w', encoding='utf-8') as f:
+        json.dump(build_test_vectors(store.version, len(store.slim_operators)), f, ensure_ascii=False)
+
+    for relative_path, source in avatars.items():
+        target = os.path.join(output_folder, relative_path)
+        if not os.path.exists(target):
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            shutil.copyfile(source, target)
+
+    shutil.copyfile(BOARDS_SCRIPT, os.path.join(output_folder, 'boards.js'))
+
+    # 页面通过 BOARD_BUNDLE 判断是否在静态站中，改为加载名册并在本地生成对局
+    with open(INDEX_PAGE, 'r', encoding='utf-8') as f:
+        page = f.read()
+    config = '    <script src="boards.js"></script>\n    <script>window.BOARD_BUNDLE = "roster.json";</script>\n'
+    page = page.replace('</head>', config + '</head>', 1)
+    with open(os.path.join(output_folder, 'index.html'), 'w', encoding='utf-8') as f:
+        f.write(page)
+
+    elapsed = time.perf_counter() - start_time
+    print(f"✅ 已导出静态站到 {output_folder}: {len(store.slim_operators)} 名干员, "
+          f"{len(avatars)} 个头像, 名册版本 {store.version}（{elapsed:.1f} s）")
+
+    if verify and verify_test_vectors(vectors_path) is False:
+        raise SystemExit("❌ JS实现的对局或校验码与Python不一致")
+    return bundle
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="导出无需后端的静态站（GitHub Pages）")
+    parser.add_argument('--output', default=SITE_FOLDER, help="输出文件夹")
+    parser.add_argument('--json-file', default='operators_data.json')
+    parser.add_argument('--avatars-folder', default='avatars')
+    parser.add_argument('--verify', action='store_true', help="导出后用node校验JS实现与Python的结果一致")
+    args = parser.parse_args()
+
+    export_static_site(args.output, args.json_file, args.avatars_folder, args.verify)
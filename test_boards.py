@@ -0,0 +1,84 @@
+"""
+对局生成规则的回归测试
+固定几个种子对应的对局，选择算法或随机数生成方式的改动会使双方（以及静态站）拿到不同的牌型
+运行: python -m pytest test_boards.py
+"""
+
+import json
+import random
+import shutil
+import subprocess
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+
+from boards import BOARD_SIZE, get_time_seed, select_board_indices, select_filtered_indices
+from static_site import BOARDS_SCRIPT, build_roster_bundle, build_test_vectors
+
+KNOWN_BOARDS = [
+    ('202501011200', 397, [49, 175, 228, 249, 8, 5, 269, 33, 311, 103, 233, 141, 279, 179, 23,
+                           1, 93, 388, 125, 306, 299, 116, 204, 364, 34, 140, 52, 105, 84, 290]),
+    ('202412312359', 397, [153, 32, 358, 169, 71, 374, 191, 52, 304, 18, 23, 94, 64, 70, 157,
+                           265, 298, 8, 209, 201, 146, 55, 372, 123, 107, 234, 315, 346, 19, 13]),
+    ('seed', 300, [70, 30, 121, 177, 146, 248, 22, 175, 270, 266, 212, 291, 210, 244, 43,
+                   211, 109, 99, 19, 144, 224, 112, 290, 89, 197, 273, 245, 38, 182, 217]),
+    ('种子', 100, [0, 72, 2, 1, 58, 99, 57, 33, 96, 68, 90, 63, 40, 21, 85,
+                 74, 52, 47, 70, 87, 20, 88, 24, 29, 55, 17, 18, 35, 98, 22]),
+    ('', 30, [14, 19, 6, 12, 23, 24, 7, 10, 28, 0, 21, 22, 11, 1, 29,
+              27, 4, 3, 2, 8, 13, 15, 20, 16, 5, 17, 18, 25, 9, 26]),
+]
+
+
+@pytest.mark.parametrize('seed, roster_size, expected', KNOWN_BOARDS)
+def test_known_boards(seed, roster_size, expected):
+    assert select_board_indices(roster_size, seed) == expected
+
+
+def test_time_seed_uses_utc8_regardless_of_zone():
+    instant = datetime(2024, 12, 31, 16, 0, 30, tzinfo=timezone.utc)
+    assert get_time_seed(instant) == '202501010000'
+    assert get_time_seed(instant.astimezone(timezone(timedelta(hours=-8)))) == '202501010000'
+    assert get_time_seed(datetime(2025, 1, 1, 0, 0, 59)) == '202501010000'
+
+
+def test_selection_does_not_touch_global_random():
+    random.seed(1234)
+    expected = random.random()
+    random.seed(1234)
+    select_board_indices(397, '202501011200')
+    assert random.random() == expected
+
+
+def test_filtered_selection_maps_candidates():
+    candidates = list(range(0, 397, 3))
+    positions = select_board_indices(len(candidates), 'seed')
+    assert select_filtered_indices(397, 'seed', candidates) == [candidates[i] for i in positions]
+    assert len(set(select_filtered_indices(397, 'seed', candidates))) == BOARD_SIZE
+
+
+
+def test_js_port_matches_python_vectors(tmp_path):
+    # 静态站的 static/boards.js 必须与Python实现逐位一致，没有node时跳过
+    node = shutil.which('node')
+    if node is None:
+        pytest.skip("未安装node")
+
+    vectors_path = tmp_path / 'test_vectors.json'
+    vectors_path.write_text(json.dumps(build_test_vectors('test-version', 397), ensure_ascii=False), encoding='utf-8')
+    result = subprocess.run([node, BOARDS_SCRIPT, str(vectors_path)], capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr + result.stdout
+
+
+def test_static_bundle_keeps_fields_missing_from_first_operator():
+    store = SimpleNamespace(version='v', slim_operators=[
+        {'id': 0, '姓名': '甲', 'avatar_url': '/avatars/甲.png', '职业': '近卫', '稀有度': 5},
+        {'id': 1, '姓名': '乙', 'avatar_url': '/static/avatars_opt/1.webp', 'avatar_png_url': '/static/avatars_opt/1.png',
+         '职业': '重装', '子职业': '铁卫', '稀有度': 4},
+    ])
+    bundle, avatars = build_roster_bundle(store)
+    rows = [dict(zip(bundle['fields'], row)) for row in bundle['operators']]
+    assert rows[0]['avatar_png_url'] is None and rows[0]['子职业'] is None
+    assert rows[1]['avatar_png_url'] == 'static/avatars_opt/1.png'
+    assert rows[1]['子职业'] == '铁卫'
+    assert avatars['avatars/甲.png'].endswith('甲.png')
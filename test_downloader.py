@@ -0,0 +1,158 @@
+"""
+头像下载器的测试，使用本地HTTP服务器代替PRTS
+覆盖连接复用（统计每批下载建立的TCP连接数）、边下载边校验、条件请求和Range续传
+运行: python -m pytest test_downloader.py
+"""
+
+import asyncio
+import hashlib
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from downloader import (
+    InvalidImageError, download_avatars_async, fetch_avatar, get_session_with_headers, resolve_avatar_target
+)
+
+AVATAR_BYTES = b'\x89PNG\r\n\x1a\n' + bytes(range(256)) * 64
+AVATAR_ETAG = '"avatar-v1"'
+
+
+class AvatarHandler(BaseHTTPRequestHandler):
+    """
+    /avatars/*.png 返回头像（支持ETag、If-Range和Range），/page.png 返回HTML页面，
+    /truncated.png 只发送一半内容后断开连接，其余路径作为主页面
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def log_message(self, *args):
+        pass
+
+    def send_body(self, status, body, content_type='image/png', headers=None, length=None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body) if length is None else length))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        with self.server.lock:
+            self.server.requests.append((self.path, dict(self.headers)))
+
+        if self.path == '/page.png':
+            self.send_body(200, b'<!DOCTYPE html><html><body>login</body></html>', 'text/html')
+            return
+        if not self.path.endswith('.png'):
+            self.send_body(200, b'home', 'text/html')
+            return
+
+        headers = {'ETag': AVATAR_ETAG, 'Accept-Ranges': 'bytes'}
+        if self.headers.get('If-None-Match') == AVATAR_ETAG:
+            self.send_response(304)
+            self.send_header('ETag', AVATAR_ETAG)
+            self.end_headers()
+            return
+
+        byte_range = self.headers.get('Range')
+        if byte_range and self.headers.get('If-Range') == AVATAR_ETAG:
+            start = int(byte_range.split('=')[1].rstrip('-'))
+            headers['Content-Range'] = f"bytes {start}-{len(AVATAR_BYTES) - 1}/{len(AVATAR_BYTES)}"
+            self.send_body(206, AVATAR_BYTES[start:], headers=headers)
+            return
+
+        if self.path == '/truncated.png':
+            half = AVATAR_BYTES[:len(AVATAR_BYTES) // 2]
+            self.send_body(200, half, headers=headers, length=len(AVATAR_BYTES))
+            self.close_connection = True
+            return
+        self.send_body(200, AVATAR_BYTES, headers=headers)
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), AvatarHandler)
+    httpd.daemon_threads = True
+    httpd.lock = threading.Lock()
+    httpd.connections = 0
+    httpd.requests = []
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    httpd.base_url = f"http://127.0.0.1:{httpd.server_address[1]}"
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_batch_reuses_pooled_connections(server, tmp_path):
+    operators = [{'姓名': f'干员{i}', '头像URL': f"{server.base_url}/avatars/{i}.png"} for i in range(8)]
+    session = get_session_with_headers(pool_size=2)
+
+    results = asyncio.run(download_avatars_async(
+        operators, str(tmp_path), session, rps=1000, concurrency=2, warm_up_url=f"{server.base_url}/"
+    ))
+
+    assert all(success for success, _, _ in results)
+    for operator in operators:
+        _, _, file_path = resolve_avatar_target(operator, str(tmp_path))
+        with open(file_path, 'rb') as f:
+            assert f.read() == AVATAR_BYTES
+    # 主页面只访问一次，且9个请求只用到连接池中的连接，而不是每个请求新建一个
+    assert [path for path, _ in server.requests].count('/') == 1
+    assert len(server.requests) == 9
+    assert server.connections <= 2
+
+
+def test_html_response_is_rejected_without_leaving_files(server, tmp_path):
+    session = get_session_with_headers(pool_size=1)
+    file_path = str(tmp_path / 'page.png')
+
+    with pytest.raises(InvalidImageError):
+        fetch_avatar(session, '干员', f"{server.base_url}/page.png", file_path)
+
+    assert os.listdir(tmp_path) == []
+
+
+def test_not_modified_avatar_is_not_downloaded(server, tmp_path):
+    session = get_session_with_headers(pool_size=1)
+    file_path = str(tmp_path / 'avatar.png')
+
+    meta = fetch_avatar(session, '干员', f"{server.base_url}/avatars/0.png", file_path)
+    assert meta['etag'] == AVATAR_ETAG
+    assert meta['sha256'] == hashlib.sha256(AVATAR_BYTES).hexdigest()
+
+    assert fetch_avatar(session, '干员', f"{server.base_url}/avatars/0.png", file_path, known_entry=meta) is None
+    assert server.requests[-1][1].get('If-None-Match') == AVATAR_ETAG
+
+
+def test_interrupted_download_resumes_with_range(server, tmp_path):
+    session = get_session_with_headers(pool_size=1)
+    url = f"{server.base_url}/truncated.png"
+    file_path = str(tmp_path / 'avatar.png')
+
+    with pytest.raises(Exception) as excinfo:
+        fetch_avatar(session, '干员', url, file_path)
+    partial = excinfo.value.partial
+    assert partial['etag'] == AVATAR_ETAG
+    assert not os.path.exists(file_path)
+    # 中断时未凑满一个数据块的尾部可能丢失，续传从.part的实际长度开始
+    assert os.path.getsize(f"{file_path}.part") == partial['bytes']
+    assert 0 < partial['bytes'] <= len(AVATAR_BYTES) // 2
+
+    meta = fetch_avatar(session, '干员', url, file_path, partial=partial)
+
+    headers = server.requests[-1][1]
+    assert headers.get('Range') == f"bytes={partial['bytes']}-"
+    with open(file_path, 'rb') as f:
+        assert f.read() == AVATAR_BYTES
+    assert meta['size'] == len(AVATAR_BYTES)
+    assert meta['sha256'] == hashlib.sha256(AVATAR_BYTES).hexdigest()
+    assert not os.path.exists(f"{file_path}.part")
@@ -0,0 +1,216 @@
+"""
+对局房间和存储后端的测试
+覆盖事件序号与断线补发、座位令牌、内存后端的过期清理，以及多个worker共享Redis时的事件转发和并发操作
+Redis使用fakeredis模拟，未安装时跳过相关测试
+运行: python -m pytest test_state_backend.py
+"""
+
+import asyncio
+
+import pytest
+
+from rooms import MAX_EVENTS, CreationLimiter, Room, RoomError, event_message
+from state_backend import MemoryBackend, RedisBackend
+
+OPERATOR_IDS = list(range(30))
+
+
+def test_room_events_have_contiguous_seqs():
+    room = Room('room', 'seed', OPERATOR_IDS, 'v', now=0)
+    room.apply('A', 'exclude', 3, now=1)
+    room.apply('B', 'exclude', 4, now=2)
+    room.apply('A', 'include', 3, now=3)
+
+    assert [event[0] for event in room.events_since(0)] == [1, 2, 3]
+    assert room.events_since(2) == [(3, 'include', 'A', 3)]
+    assert room.events_since(3) == []
+    assert room.excluded == {'A': set(), 'B': {4}}
+    assert room.touched_at == 3
+
+
+def test_room_rejects_invalid_events():
+    room = Room('room', 'seed', OPERATOR_IDS, 'v', now=0)
+    room.apply('A', 'select', 5)
+    with pytest.raises(RoomError):
+        room.apply('A', 'select', 6)
+    with pytest.raises(RoomError):
+        room.apply('spectator', 'exclude', 1)
+    with pytest.raises(RoomError):
+        room.apply('B', 'exclude', 999)
+    with pytest.raises(RoomError):
+        room.apply('B', 'flip', 1)
+    assert room.seq == 1
+
+
+def test_events_since_falls_back_to_snapshot():
+    room = Room('room', 'seed', OPERATOR_IDS, 'v', now=0)
+    for i in range(MAX_EVENTS + 10):
+        room.apply('A', 'exclude' if i % 2 == 0 else 'include', i % 30)
+
+    # 所需事件已不在保留范围内，或客户端的序号超前时改发完整状态
+    assert room.events_since(5) is None
+    assert room.events_since(room.seq + 1) is None
+    assert len(room.events_since(room.seq - MAX_EVENTS)) == MAX_EVENTS
+
+
+def test_selection_is_only_visible_to_its_player():
+    room = Room('room', 'seed', OPERATOR_IDS, 'v', now=0)
+    event = room.apply('A', 'select', 7)
+
+    assert event_message(event, 'A')['operator_id'] == 7
+    assert event_message(event, 'B')['operator_id'] is None
+    assert room.snapshot('A')['players']['A']['selected'] == 7
+    assert room.snapshot('B')['players']['A']['selected'] is True
+
+
+def test_seat_tokens_are_issued_once():
+    room = Room('room', 'seed', OPERATOR_IDS, 'v', now=0)
+    token = room.join('A')
+
+    with pytest.raises(RoomError):
+        room.join('A')
+    with pytest.raises(RoomError):
+        room.join('spectator')
+    assert room.check_token('A', token)
+    assert not room.check_token('B', token)
+    assert not room.check_token('A', None)
+
+    restored = Room.from_state(room.to_state())
+    assert restored.check_token('A', token)
+    assert restored.snapshot()['players']['B']['joined'] is False
+
+
+def test_creation_limiter_counts_per_client():
+    limiter = CreationLimiter(limit=2, window=10)
+    assert limiter.allow('a', now=0) and limiter.allow('a', now=1)
+    assert not limiter.allow('a', now=2)
+    assert limiter.allow('b', now=2)
+    assert limiter.allow('a', now=10.5)
+
+
+def test_memory_backend_evicts_idle_rooms():
+    async def run():
+        backend = MemoryBackend(ttl=100, unjoined_ttl=10)
+        unjoined = await backend.create_room('a', OPERATOR_IDS, 'v')
+        joined = await backend.create_room('b', OPERATOR_IDS, 'v')
+        connected = await backend.create_room('c', OPERATOR_IDS, 'v')
+        await backend.join(joined.room_id, 'A')
+        queue = backend.subscribe(connected.room_id)
+
+        for room in (unjoined, joined, connected):
+            room.touched_at -= 50
+        assert await backend.evict_expired() == 1
+        assert await backend.get_room(unjoined.room_id) is None
+
+        for room in (joined, connected):
+            room.touched_at -= 100
+        # 仍有连接的房间不会被清理
+        assert await backend.evict_expired() == 1
+        assert await backend.get_room(connected.room_id) is connected
+        backend.unsubscribe(connected.room_id, queue)
+        assert await backend.room_count() == 1
+        assert backend.evicted == 2
+
+    asyncio.run(run())
+
+
+def test_memory_backend_rejects_rooms_over_limit():
+    async def run():
+        backend = MemoryBackend(max_rooms=2)
+        await backend.create_room('a', OPERATOR_IDS, 'v')
+        await backend.create_room('b', OPERATOR_IDS, 'v')
+        with pytest.raises(RoomError):
+            await backend.create_room('c', OPERATOR_IDS, 'v')
+
+    asyncio.run(run())
+
+
+def test_memory_backend_allows_one_connection_per_seat():
+    async def run():
+        backend = MemoryBackend()
+        room = await backend.create_room('a', OPERATOR_IDS, 'v')
+        assert await backend.claim_seat(room.room_id, 'A')
+        assert not await backend.claim_seat(room.room_id, 'A')
+        assert await backend.claim_seat(room.room_id, 'B')
+        await backend.release_seat(room.room_id, 'A')
+        assert await backend.claim_seat(room.room_id, 'A')
+
+    asyncio.run(run())
+
+
+def redis_backends(count=2):
+    """
+    连接同一个FakeServer的多个RedisBackend，相当于共享一个Redis的多个worker
+    """
+    fakeredis = pytest.importorskip('fakeredis')
+    server = fakeredis.FakeServer()
+    return [RedisBackend(fakeredis.aioredis.FakeRedis(server=server)) for _ in range(count)]
+
+
+def test_redis_events_reach_other_workers():
+    backends = redis_backends()
+
+    async def run():
+        first, second = backends
+        for backend in backends:
+            await backend.start()
+        try:
+            room = await first.create_room('seed', OPERATOR_IDS, 'v')
+            queue = second.subscribe(room.room_id)
+            event = await first.apply(room.room_id, 'A', 'exclude', 3)
+
+            assert await asyncio.wait_for(queue.get(), timeout=2) == event
+            assert (await second.get_room(room.room_id)).excluded['A'] == {3}
+        finally:
+            for backend in backends:
+                await backend.close()
+
+    asyncio.run(run())
+
+
+def test_redis_concurrent_applies_get_contiguous_seqs():
+    backends = redis_backends()
+
+    async def run():
+        first, second = backends
+        room = await first.create_room('seed', OPERATOR_IDS, 'v')
+        events = await asyncio.gather(*(
+            backends[i % 2].apply(room.room_id, 'AB'[i % 2], 'exclude', i) for i in range(20)
+        ))
+
+        assert sorted(event[0] for event in events) == list(range(1, 21))
+        stored = await second.get_room(room.room_id)
+        assert stored.seq == 20
+        assert stored.excluded['A'] | stored.excluded['B'] == set(range(20))
+        assert [event[0] for event in stored.events_since(0)] == list(range(1, 21))
+        for backend in backends:
+            await backend.close()
+
+    asyncio.run(run())
+
+
+def test_redis_seats_are_shared_across_workers():
+    backends = redis_backends()
+
+    async def run():
+        first, second = backends
+        room = await first.create_room('seed', OPERATOR_IDS, 'v')
+        assert await first.client.ttl(first._room_key(room.room_id)) == first.unjoined_ttl
+
+        token = await second.join(room.room_id, 'A')
+        assert (await first.get_room(room.room_id)).check_token('A', token)
+        assert await first.client.ttl(first._room_key(room.room_id)) == first.ttl
+        with pytest.raises(RoomError):
+            await first.join(room.room_id, 'A')
+
+        assert await first.claim_seat(room.room_id, 'A')
+        assert not await second.claim_seat(room.room_id, 'A')
+        # 只有占用座位的worker能释放它
+        await second.release_seat(room.room_id, 'A')
+        assert not await second.claim_seat(room.room_id, 'A')
+        await first.release_seat(room.room_id, 'A')
+        assert await second.claim_seat(room.room_id, 'A')
+        for backend in backends:
+            await backend.close()
+
+    asyncio.run(run())